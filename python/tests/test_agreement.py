@@ -0,0 +1,53 @@
+import pytest
+from ua_gec import AnnotatedText, Corpus
+from ua_gec.agreement import Agreement, compute_agreement, iter_document_pairs
+
+
+def test_identical():
+    text = AnnotatedText("{Helo=>Hello:::error_type=Spelling} world{=>!:::error_type=Punctuation}")
+    agreement = Agreement()
+    agreement.add(text, text)
+    assert agreement.exact_agreement == 1.0
+    assert agreement.overlap_agreement == 1.0
+    assert agreement.suggestion_agreement == 1.0
+    assert agreement.error_type_kappa() == 1.0
+
+
+def test_partial():
+    text_1 = AnnotatedText(
+        "{Helo=>Hello:::error_type=Spelling} {big world=>world:::error_type=F/Style}.")
+    text_2 = AnnotatedText(
+        "{Helo=>Hi:::error_type=Spelling} big {world=>World:::error_type=Spelling}{=>!:::error_type=Punctuation}.")
+    agreement = Agreement()
+    agreement.add(text_1, text_2)
+
+    assert agreement.spans == [2, 3]
+    assert agreement.exact == 1
+    assert agreement.exact_agreement == 2 / 5
+    assert agreement.overlapping == [2, 2]  # "big world" overlaps "world"
+    assert agreement.suggestion_agreement == 0.0
+    assert agreement.labels == {
+        ("Spelling", "Spelling"): 1,
+        ("F/Style", "none"): 1,
+        ("none", "Spelling"): 1,
+        ("none", "Punctuation"): 1,
+    }
+    assert set(agreement.kappa_by_error_type()) == {"Spelling", "F/Style", "Punctuation"}
+
+
+def test_different_source():
+    with pytest.raises(ValueError):
+        Agreement().add(AnnotatedText("a b"), AnnotatedText("a c"))
+
+
+def test_corpus():
+    corpus = Corpus("test")
+    pairs = list(iter_document_pairs(corpus))
+    assert pairs
+    for doc_1, doc_2 in pairs:
+        assert doc_1.doc_id == doc_2.doc_id
+        assert (doc_1.meta.annotator_id, doc_2.meta.annotator_id) == (1, 2)
+
+    agreement = compute_agreement(corpus)
+    assert agreement.documents + agreement.skipped == len(pairs)
+    assert compute_agreement(corpus, workers=2).to_dict() == agreement.to_dict()
@@ -0,0 +1,56 @@
+import itertools
+import pathlib
+
+import pytest
+from ua_gec import Corpus
+from ua_gec.batching import BatchGenerator, iter_sentence_pairs
+
+
+class TestBatchGenerator:
+
+    def test_epoch_covers_all_pairs(self, corpus):
+        batches = BatchGenerator(corpus, max_tokens=500, buffer_size=300)
+        pairs = [pair for batch in batches.iter_epoch(0) for pair in batch]
+        assert sorted(pairs) == sorted(iter_sentence_pairs(corpus))
+
+    def test_token_budget(self, corpus):
+        batches = BatchGenerator(corpus, max_tokens=500)
+        for batch in batches:
+            max_len = max(max(len(s.split()), len(t.split())) for s, t in batch)
+            assert len(batch) == 1 or len(batch) * max_len <= 500
+
+    def test_deterministic(self, corpus):
+        batches_1 = list(BatchGenerator(corpus, seed=1).iter_epoch(3))
+        batches_2 = list(BatchGenerator(corpus, seed=1).iter_epoch(3))
+        batches_3 = list(BatchGenerator(corpus, seed=2).iter_epoch(3))
+        assert batches_1 == batches_2
+        assert batches_1 != batches_3
+
+    def test_epochs_mix_different_pairs(self, corpus):
+        batches = BatchGenerator(corpus, buffer_size=100)
+        first_buffer = lambda epoch: {
+            pair for batch in itertools.islice(batches.iter_epoch(epoch), 3) for pair in batch}
+        assert first_buffer(0) != first_buffer(1)
+
+    def test_later_epochs_read_only_sentences(self, corpus, monkeypatch):
+        batches = BatchGenerator(corpus, buffer_size=10000)
+        epoch_1 = list(batches.iter_epoch(1))
+
+        read = []
+        read_text = pathlib.Path.read_text
+        monkeypatch.setattr(pathlib.Path, "read_text",
+                            lambda path, *args, **kwargs: read.append(path)
+                            or read_text(path, *args, **kwargs))
+        assert list(batches.iter_epoch(1)) == epoch_1
+        assert not [path for path in read if path.suffix == ".ann"]
+        assert len(read) == 2 * len(corpus)
+        assert {path.parent.name for path in read} == {
+            "source-sentences-tokenized", "target-sentences-tokenized"}
+
+    def test_bad_arguments(self, corpus):
+        with pytest.raises(ValueError):
+            BatchGenerator(corpus, max_tokens=0)
+
+    @pytest.fixture
+    def corpus(self):
+        return Corpus("test")
@@ -0,0 +1,37 @@
+import pickle
+
+from ua_gec.cache import SentenceCache
+
+
+def test_get_put(tmp_path):
+    cache = SentenceCache(tmp_path / "cache.sqlite", "v1")
+    assert cache.get_many(["a", "b"]) == {}
+    cache.put_many({"a": b"1", "b": b"2"})
+    assert cache.get_many(["a", "b", "c"]) == {"a": b"1", "b": b"2"}
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert cache.hit_rate == 2 / 5
+
+
+def test_persistent(tmp_path):
+    path = tmp_path / "sub" / "cache.sqlite"
+    with SentenceCache(path, "v1") as cache:
+        cache.put_many({"a": b"1"})
+
+    with SentenceCache(path, "v1") as cache:
+        assert cache.get_many(["a"]) == {"a": b"1"}
+    with SentenceCache(path, "v2") as cache:
+        assert cache.get_many(["a"]) == {}
+
+
+def test_many_keys(tmp_path):
+    cache = SentenceCache(tmp_path / "cache.sqlite", "v1")
+    values = {str(i): str(i).encode() for i in range(2000)}
+    cache.put_many(values)
+    assert cache.get_many(values) == values
+
+
+def test_pickle(tmp_path):
+    cache = SentenceCache(tmp_path / "cache.sqlite", "v1")
+    cache.put_many({"a": b"1"})
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get_many(["a"]) == {"a": b"1"}
@@ -1,5 +1,8 @@
+import argparse
+
 import pytest
-from ua_gec import Corpus, Document, AnnotatedText, AnnotationLayer
+from ua_gec import Corpus, Document, AnnotatedText, AnnotationLayer, ProjectedCorpus
+from ua_gec.corpus import parse_shard, shard_doc_ids
 
 
 class TestCorpus:
@@ -23,6 +26,10 @@ class TestCorpus:
         with pytest.raises(LookupError):
             corpus.get_doc("THIS ID DOSN'T EXISTS")
 
+    def test_select(self):
+        subset = Corpus("test").select({"1224"})
+        assert [doc.meta.annotator_id for doc in subset] == [1, 2]
+
     def test_two_annotators(self):
         corpus = Corpus("test")
         doc_a1 = corpus.get_doc("1224", annotator_id=1)
@@ -65,3 +72,78 @@ class TestCorpus:
     @pytest.fixture
     def corpus(self):
         return Corpus()
+
+
+class TestProjectedCorpus:
+
+    def test_drops_fluency_edits(self):
+        corpus = ProjectedCorpus("train")
+        doc = corpus.get_doc("0012")
+
+        s = "число і опис не {співпадають=>збігаються:::error_type=F/Calque}"
+        assert s not in str(doc.annotated)
+        assert doc.source == Corpus("train").get_doc("0012").source
+        for ann in doc.annotated.get_annotations():
+            assert not ann.meta["error_type"].startswith("F/")
+
+    def test_custom_predicate(self):
+        corpus = ProjectedCorpus("test", keep=lambda t: t == "Punctuation")
+        for doc in corpus:
+            for ann in doc.annotated.get_annotations():
+                assert ann.meta["error_type"] == "Punctuation"
+
+    def test_source_sentences_shared(self):
+        doc = ProjectedCorpus("test").get_doc("1224")
+        assert doc.source_sentences_tokenized[0] == "Шон Байзель ."
+        with pytest.raises(LookupError):
+            doc.target_sentences
+
+    def test_iter_after_get_documents(self):
+        corpus = ProjectedCorpus("test")
+        assert len(list(corpus)) == len(corpus.get_documents()) == len(corpus)
+
+
+class TestShard:
+
+    @pytest.mark.parametrize("balance", ["chars", "bytes", "docs"])
+    def test_shards_partition_corpus(self, balance):
+        corpus = Corpus("test")
+        shards = [corpus.shard(3, i, balance=balance) for i in range(3)]
+
+        metas = [meta for shard in shards for meta in shard._get_metadata()]
+        assert sorted(metas) == sorted(corpus._get_metadata())
+
+    def test_annotators_in_same_shard(self):
+        corpus = Corpus("test")
+        for i in range(4):
+            shard = corpus.shard(4, i)
+            annotators = {doc.meta.annotator_id for doc in shard
+                          if doc.doc_id == "1224"}
+            assert annotators in (set(), {1, 2})
+
+    def test_deterministic_and_balanced(self):
+        shard_1 = Corpus("train").shard(2, 0, balance="docs")
+        shard_2 = Corpus("train").shard(2, 0, balance="docs")
+        assert shard_1._get_metadata() == shard_2._get_metadata()
+
+        doc_ids = {meta.doc_id for meta in shard_1._get_metadata()}
+        assert abs(len(doc_ids) - 1706 / 2) <= 1
+
+    def test_bad_index(self):
+        with pytest.raises(ValueError):
+            Corpus("test").shard(2, 2)
+
+    def test_layers_in_same_shard(self):
+        layers = [Corpus("test", layer) for layer in AnnotationLayer]
+        shards = [shard_doc_ids(layers, 3, i) for i in range(3)]
+
+        assert set.union(*shards) == {meta.doc_id for meta in layers[0]._get_metadata()}
+        assert sum(len(shard) for shard in shards) == len(set.union(*shards))
+        assert shard_doc_ids(layers[:1], 3, 0) == {
+            meta.doc_id for meta in layers[0].shard(3, 0)._get_metadata()}
+
+    def test_parse_shard(self):
+        assert parse_shard("1/4") == (1, 4)
+        for value in ("4/4", "-1/4", "1", "a/b"):
+            with pytest.raises(argparse.ArgumentTypeError):
+                parse_shard(value)
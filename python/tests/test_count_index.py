@@ -0,0 +1,87 @@
+import pathlib
+import shutil
+
+import pytest
+from ua_gec import Corpus, ProjectedCorpus
+from ua_gec.count_index import INDEX_NAME, CountIndex, DocCounts, count_document
+
+
+class TestCountIndex:
+
+    def test_build(self, corpus):
+        index = CountIndex.build(corpus)
+        doc = corpus.get_doc("1224", annotator_id=2)
+
+        assert len(index) == len(corpus)
+        assert index.get(doc.meta) == count_document(doc)
+        assert index.get(doc.meta).sentences == 6
+        assert index.get(doc.meta).chars == len(doc.source)
+
+    def test_save_load(self, corpus, tmp_path):
+        index = CountIndex.build(corpus)
+        index.save(tmp_path / "index.json")
+        loaded = CountIndex.load(tmp_path / "index.json")
+
+        assert loaded.layer == "gec-fluency"
+        assert loaded.manifest == index.manifest
+        assert loaded.counts == index.counts
+        assert CountIndex.load(tmp_path / "missing.json") is None
+
+    def test_reuses_unchanged_counts(self, corpus):
+        previous = CountIndex.build(corpus)
+        fake = DocCounts(1, 2, 3, {})
+        previous.counts["gec-fluency/1224.a1"] = fake
+        previous.counts["gec-fluency/1224.a2"] = fake
+        previous.manifest.hashes["gec-fluency/1224.a2"] = "0" * 64
+        previous.manifest.stats["gec-fluency/1224.a2"] = [0, 0]
+
+        index = CountIndex.build(corpus, previous)
+
+        assert index.counts["gec-fluency/1224.a1"] == fake
+        assert index.counts["gec-fluency/1224.a2"] != fake
+
+    def test_for_corpus_without_saving(self, corpus):
+        index = CountIndex.for_corpus(corpus, save=False)
+        assert index.counts == CountIndex.build(corpus).counts
+
+    def test_saves_only_on_request(self, data_copy, monkeypatch):
+        corpus = Corpus("test", root=data_copy)
+        path = data_copy / "gec-fluency" / "test" / INDEX_NAME
+        CountIndex.for_corpus(corpus)
+        assert not path.exists()
+        CountIndex.for_corpus(corpus, save=True)
+        assert path.exists()
+
+        def read_only(self, path):
+            raise PermissionError(f"Permission denied: {path}")
+        monkeypatch.setattr(CountIndex, "save", read_only)
+        path.unlink()
+        with pytest.warns(UserWarning, match="Can't save the count index"):
+            CountIndex.for_corpus(corpus, save=True)
+
+    def test_recounts_changed_sentences(self, data_copy):
+        corpus = Corpus("test", root=data_copy)
+        previous = CountIndex.build(corpus)
+        meta = corpus.get_doc("1224", annotator_id=1).meta
+        path = corpus._view_path(meta, "source-sentences-tokenized")
+        path.write_text(path.read_text(encoding="utf-8") + "one more sentence\n", encoding="utf-8")
+
+        index = CountIndex.build(corpus, previous)
+        assert index.get(meta).sentences == previous.get(meta).sentences + 1
+
+    def test_projection(self):
+        corpus = ProjectedCorpus("test", keep=lambda t: t == "Spelling")
+        index = CountIndex.for_corpus(corpus, save=False)
+        for counts in index.counts.values():
+            assert set(counts.errors) <= {"Spelling"}
+
+    @pytest.fixture
+    def corpus(self):
+        return Corpus("test")
+
+    @pytest.fixture
+    def data_copy(self, tmp_path):
+        data_dir = pathlib.Path(Corpus("test").data_dir).parent
+        shutil.copy(data_dir / "metadata.csv", tmp_path)
+        shutil.copytree(data_dir / "gec-fluency" / "test", tmp_path / "gec-fluency" / "test")
+        return tmp_path
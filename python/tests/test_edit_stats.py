@@ -0,0 +1,46 @@
+import pytest
+from ua_gec import Corpus
+from ua_gec.count_index import CountIndex
+from ua_gec import edit_stats
+from ua_gec.edit_stats import EDIT_KINDS, compute_edit_stats, extract_columns
+
+
+@pytest.fixture(scope="module")
+def columns():
+    corpus = Corpus("test")
+    return extract_columns(corpus, CountIndex.for_corpus(corpus, save=False))
+
+
+def test_columns(columns):
+    assert len(columns.records) == len(columns.tokens) == 332  # 166 docs x 2 annotators
+    n = len(columns)
+    assert n > 0
+    for column in (columns.sentence, columns.error_type, columns.source_len,
+                   columns.suggestion_len, columns.kind):
+        assert len(column) == n
+
+
+def test_stats(columns):
+    stats = compute_edit_stats(columns, use_numpy=False)
+    n = stats["Annotations"]
+    assert sum(stats["Edit length (tokens)"]["source"].values()) == n
+    assert sum(stats["Edit length (tokens)"]["suggestion"].values()) == n
+    assert sum(kind["count"] for kind in stats["Edit kinds"].values()) == n
+    assert list(stats["Edit kinds"]) == list(EDIT_KINDS)
+    assert stats["Errors per 1k tokens"]["Total"]["All"] > 0
+
+    cooccurrence = stats["Error type co-occurrence (sentences)"]
+    for a, row in cooccurrence.items():
+        for b, count in row.items():
+            assert cooccurrence[b][a] == count
+            assert count <= row[a]
+
+
+def test_numpy_matches_python(columns):
+    pytest.importorskip("numpy")
+    assert compute_edit_stats(columns, use_numpy=True) == compute_edit_stats(columns, use_numpy=False)
+
+
+def test_without_numpy(columns, monkeypatch):
+    monkeypatch.setattr(edit_stats, "np", None)
+    assert compute_edit_stats(columns)["Annotations"] == len(columns)
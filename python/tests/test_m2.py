@@ -0,0 +1,98 @@
+import pytest
+from ua_gec.m2 import M2Edit, M2Reader, M2Writer, doc_heading, parse_edit
+
+DOC_1 = doc_heading("0001") + """\
+S Helo world .
+A 0 1|||Spelling|||Hello|||REQUIRED|||-NONE-|||0
+A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||1
+
+S Bye
+A 1 1|||Punctuation|||.|||REQUIRED|||-NONE-|||0
+
+"""
+DOC_2 = doc_heading("0002") + """\
+S Fine .
+A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0
+
+"""
+
+
+@pytest.fixture
+def m2_path(tmp_path):
+    path = tmp_path / "test.m2"
+    with M2Writer(path) as writer:
+        writer.write(DOC_1)
+        writer.write(DOC_2)
+    return path
+
+
+def test_writer(m2_path):
+    assert m2_path.read_text(encoding="utf-8") == DOC_1 + DOC_2
+    assert not (m2_path.parent / "test.m2.tmp").exists()
+
+
+def test_writer_error_keeps_old_file(m2_path):
+    with pytest.raises(RuntimeError):
+        with M2Writer(m2_path) as writer:
+            writer.write(DOC_2)
+            raise RuntimeError()
+    assert m2_path.read_text(encoding="utf-8") == DOC_1 + DOC_2
+    assert not (m2_path.parent / "test.m2.tmp").exists()
+
+
+def test_parse_edit():
+    edit = parse_edit("A 0 2|||Spelling|||a b|||REQUIRED|||-NONE-|||1\n")
+    assert edit == M2Edit(0, 2, "Spelling", "a b", 1)
+
+
+def test_random_access(m2_path):
+    reader = M2Reader(m2_path)
+    assert len(reader) == 5
+    assert reader.doc_ids() == ["0001", "0002"]
+    assert reader.document_text("0002") == DOC_2
+    assert reader.document_text("0001") == DOC_1
+
+    sentence = reader.sentence(2)
+    assert sentence.source == "Bye"
+    assert sentence.doc_id == "0001"
+    assert sentence.edits == [M2Edit(1, 1, "Punctuation", ".", 0)]
+    assert reader.sentence(0).source == "# 0001"
+
+    assert [s.source for s in reader.document("0001")] == ["Helo world .", "Bye"]
+    with pytest.raises(LookupError):
+        reader.document("0003")
+    with pytest.raises(IndexError):
+        reader.sentence(5)
+
+
+def test_iteration(m2_path):
+    reader = M2Reader(m2_path)
+    sentences = list(reader)
+    assert [s.doc_id for s in sentences] == ["0001"] * 3 + ["0002"] * 2
+    assert sentences[1] == reader.sentence(1)
+    assert [e.type for e in reader.iter_edits()].count("noop") == 6
+
+
+def test_hashtag_sentence_is_not_a_heading(tmp_path):
+    # A one-token `# X` sentence without edits renders like a heading
+    hashtag = """\
+S # генетичні_хвороби
+A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0
+A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||1
+
+S # X
+A 1 2|||Spelling|||Y|||REQUIRED|||-NONE-|||0
+
+"""
+    doc_1 = DOC_1 + hashtag
+    path = tmp_path / "test.m2"
+    path.write_text(doc_1 + DOC_2, encoding="utf-8")
+
+    reader = M2Reader(path, doc_ids=["0001", "0002"])
+    assert reader.doc_ids() == ["0001", "0002"]
+    assert reader.document_text("0001") == doc_1
+    assert [s.source for s in reader.document("0001")][-2:] == ["# генетичні_хвороби", "# X"]
+    assert [s.doc_id for s in reader] == ["0001"] * 5 + ["0002"] * 2
+
+    # Without doc_ids, only blocks that aren't an exact heading are excluded
+    assert M2Reader(path).doc_ids() == ["0001", "генетичні_хвороби", "0002"]
@@ -0,0 +1,41 @@
+import importlib.util
+import pathlib
+
+import pytest
+from ua_gec import AnnotationLayer, Corpus
+
+SCRIPT = pathlib.Path(__file__).parent.parent.parent / "scripts" / "make_m2.py"
+
+
+@pytest.fixture(scope="module")
+def make_m2():
+    pytest.importorskip("tqdm")
+    spec = importlib.util.spec_from_file_location("make_m2", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _apply(tokens, edits):
+    tokens = list(tokens)
+    for edit in sorted(edits, key=lambda edit: (edit.o_start, edit.o_end), reverse=True):
+        tokens[edit.o_start:edit.o_end] = edit.c_str.split()
+    return tokens
+
+
+@pytest.mark.parametrize("layer", list(AnnotationLayer))
+def test_native_edits_reproduce_target_sentences(make_m2, layer):
+    for doc in Corpus("test", layer):
+        edits = make_m2.get_native_edits(doc)
+        sentences = zip(doc.source_sentences_tokenized, doc.target_sentences_tokenized, edits)
+        for source, target, sentence_edits in sentences:
+            assert _apply(source.split(), sentence_edits) == target.split(), doc.doc_id
+            starts = [edit.o_start for edit in sentence_edits if edit.o_start == edit.o_end]
+            assert len(starts) == len(set(starts))
+
+
+def test_token_moved_to_next_sentence(make_m2):
+    doc = Corpus("test").get_doc("0111", annotator_id=1)
+    edits = make_m2.get_native_edits(doc)
+    assert edits[0][-1] == make_m2.NativeEdit(9, 10, "Punctuation", "")
+    assert edits[1][0] == make_m2.NativeEdit(0, 0, "Punctuation", "—")
@@ -0,0 +1,86 @@
+import os
+import pathlib
+import shutil
+
+import pytest
+from ua_gec import Corpus
+from ua_gec.manifest import Manifest, make_key, parse_key
+
+
+class TestManifest:
+
+    def test_build(self, corpus):
+        manifest = Manifest.build(corpus, "tool/1")
+        assert len(manifest.hashes) == len(corpus)
+        assert "gec-fluency/1224.a2" in manifest.hashes
+
+    def test_save_load(self, corpus, tmp_path):
+        manifest = Manifest.build(corpus, "tool/1")
+        manifest.save(tmp_path / "manifest.json")
+        assert Manifest.load(tmp_path / "manifest.json") == manifest
+        assert Manifest.load(tmp_path / "missing.json") is None
+
+    def test_changed_doc_ids(self, corpus):
+        new = Manifest.build(corpus, "tool/1")
+        old = Manifest("tool/1", new.hashes)
+        assert new.changed_doc_ids(old) == set()
+
+        old.hashes["gec-fluency/1224.a2"] = "0" * 64
+        old.hashes["gec-fluency/9999.a1"] = "0" * 64
+        assert new.changed_doc_ids(old) == {"1224", "9999"}
+
+    def test_tool_version_changed(self, corpus):
+        new = Manifest.build(corpus, "tool/2")
+        old = Manifest("tool/1", new.hashes)
+        assert len(new.changed_doc_ids(old)) == 166
+        assert new.changed_keys(old) == set(new.hashes)
+        assert new.changed_keys(None) == set(new.hashes)
+
+    def test_key(self, corpus):
+        meta = corpus.get_doc("1224", annotator_id=2).meta
+        assert parse_key(make_key("gec-only", meta)) == ("gec-only", "1224", 2)
+
+    def test_views(self, data_copy):
+        corpus = Corpus("test", root=data_copy)
+        views = ("target-sentences-tokenized",)
+        old = Manifest.build(corpus, "tool/1", views)
+        old_plain = Manifest.build(corpus, "tool/1")
+
+        path = corpus._view_path(corpus.get_doc("1224", annotator_id=2).meta, views[0])
+        path.write_text(path.read_text(encoding="utf-8") + "x\n", encoding="utf-8")
+
+        assert Manifest.build(corpus, "tool/1", views).changed_doc_ids(old) == {"1224"}
+        assert Manifest.build(corpus, "tool/1").changed_doc_ids(old_plain) == set()
+
+    def test_hashes_only_files_with_changed_stats(self, data_copy, monkeypatch):
+        corpus = Corpus("test", root=data_copy)
+        views = ("source-sentences-tokenized",)
+        old = Manifest.build(corpus, "tool/1", views)
+        meta_1 = corpus.get_doc("1224", annotator_id=1).meta
+        meta_2 = corpus.get_doc("1224", annotator_id=2).meta
+        ann_path = corpus._annotated_path(meta_2)
+        ann_path.write_text(ann_path.read_text(encoding="utf-8") + "x", encoding="utf-8")
+        view_path = corpus._view_path(meta_1, views[0])
+        stat = view_path.stat()
+        os.utime(view_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        read = []
+        read_bytes = pathlib.Path.read_bytes
+        monkeypatch.setattr(pathlib.Path, "read_bytes",
+                            lambda path: read.append(path) or read_bytes(path))
+        new = Manifest.build(corpus, "tool/1", views, previous=old)
+
+        assert set(read) == {corpus._annotated_path(meta_1), view_path, ann_path}
+        assert new == Manifest.build(corpus, "tool/1", views)
+        assert new.changed_doc_ids(old) == {"1224"}
+
+    @pytest.fixture
+    def corpus(self):
+        return Corpus("test")
+
+    @pytest.fixture
+    def data_copy(self, tmp_path):
+        data_dir = pathlib.Path(Corpus("test").data_dir).parent
+        shutil.copy(data_dir / "metadata.csv", tmp_path)
+        shutil.copytree(data_dir / "gec-fluency" / "test", tmp_path / "gec-fluency" / "test")
+        return tmp_path
@@ -0,0 +1,50 @@
+import pytest
+from ua_gec import Corpus
+from ua_gec.count_index import CountIndex
+from ua_gec.stats import CorpusStatistics, PartialStats, compute_partial_stats
+
+
+class TestCorpusStatistics:
+
+    def test_total(self, stats):
+        total = stats.stats["Total"]["All"]
+        assert total["Documents"] == 166
+        assert total["Sentences"] > total["Documents"]
+        assert total["Tokens"] > total["Sentences"]
+
+    def test_breakdowns_add_up(self, stats):
+        total = stats.stats["Total"]["All"]
+        for title in ("By gender", "By native", "By submission type"):
+            subsets = stats.stats[title].values()
+            assert sum(s["Documents"] for s in subsets) == total["Documents"]
+            assert sum(s["Tokens"] for s in subsets) == total["Tokens"]
+
+    def test_errors(self, stats):
+        errors = stats.stats["Number of errors (by 2 annotators)"]
+        assert errors["TOTAL"] == sum(n for t, n in errors.items() if t != "TOTAL")
+
+    def test_pretty_print(self, stats, capsys):
+        stats.pretty_print()
+        out = capsys.readouterr().out
+        assert out.startswith("# By gender\n")
+        assert "# Total\nAll" in out
+
+    def test_workers(self, stats):
+        corpus = Corpus("test")
+        parallel = CorpusStatistics(corpus, stats.index, workers=2)
+        assert parallel.stats == stats.stats
+
+    def test_merge_partial_stats(self, stats):
+        corpus = Corpus("test")
+        shards = [corpus.shard(3, i) for i in range(3)]
+        partials = [compute_partial_stats(shard, stats.index)[0] for shard in shards]
+
+        merged_1 = PartialStats().merge(partials[0]).merge(partials[1]).merge(partials[2])
+        merged_2 = PartialStats().merge(partials[2]).merge(
+            PartialStats().merge(partials[1]).merge(partials[0]))
+        assert merged_1.to_stats() == merged_2.to_stats() == stats.stats
+
+    @pytest.fixture
+    def stats(self):
+        corpus = Corpus("test")
+        return CorpusStatistics(corpus, CountIndex.for_corpus(corpus, save=False))
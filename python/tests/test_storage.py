@@ -0,0 +1,117 @@
+import concurrent.futures
+import pathlib
+import pickle
+import tarfile
+import zipfile
+
+import pytest
+from ua_gec import Corpus
+from ua_gec.storage import ArchivePath, open_root
+
+DATA_DIR = pathlib.Path(__file__).parent.parent / "ua_gec" / "data"
+
+
+def _test_partition_files():
+    yield DATA_DIR / "metadata.csv"
+    yield from (DATA_DIR / "gec-fluency" / "test").glob("*/*")
+
+
+@pytest.fixture(scope="module")
+def zip_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("archives") / "ua-gec.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for file in _test_partition_files():
+            zf.write(file, "ua-gec/data/" + file.relative_to(DATA_DIR).as_posix())
+    return path
+
+
+@pytest.fixture(scope="module", params=["w", "w:gz"])
+def tar_path(tmp_path_factory, request):
+    path = tmp_path_factory.mktemp("archives") / "ua-gec.tar"
+    with tarfile.open(path, request.param) as tar:
+        for file in _test_partition_files():
+            tar.add(file, "./data/" + file.relative_to(DATA_DIR).as_posix())
+    return path
+
+
+def _assert_same_corpus(root):
+    expected = Corpus("test")
+    actual = Corpus("test", root=root)
+    assert len(actual) == len(expected)
+    for doc_1, doc_2 in zip(actual, expected):
+        assert doc_1.meta == doc_2.meta
+        assert doc_1.annotated == doc_2.annotated
+        assert doc_1.source_sentences == doc_2.source_sentences
+        assert doc_1.target_sentences_tokenized == doc_2.target_sentences_tokenized
+
+
+def test_zip(zip_path):
+    _assert_same_corpus(zip_path)
+
+
+def test_tar(tar_path):
+    _assert_same_corpus(tar_path)
+
+
+def test_directory():
+    assert open_root(DATA_DIR) == DATA_DIR
+    _assert_same_corpus(DATA_DIR)
+
+
+def test_archive_path(zip_path):
+    root = open_root(zip_path)
+    assert isinstance(root, ArchivePath)
+    path = root / "gec-fluency" / ".." / "metadata.csv"
+    assert path == root / "metadata.csv"
+    assert path.stat().st_size == (DATA_DIR / "metadata.csv").stat().st_size
+    assert (root / "gec-fluency").exists()
+    with pytest.raises(FileNotFoundError):
+        (root / "missing.txt").read_text()
+
+
+def test_exists(tar_path):
+    root = open_root(tar_path)
+    assert root.exists()
+    assert (root / "gec-fluency" / "test").exists()
+    assert (root / "metadata.csv").exists()
+    assert not (root / "gec-flu").exists()
+    assert not (root / "metadata").exists()
+
+
+def test_close(zip_path, tar_path):
+    for path in (zip_path, tar_path):
+        with open_root(path).archive as archive:
+            assert archive.read(archive.find_root() + "/metadata.csv")
+        with pytest.raises(ValueError):
+            archive.read(archive.find_root() + "/metadata.csv")
+
+
+def test_corpus_close(zip_path):
+    with Corpus("test", root=zip_path) as corpus:
+        doc = next(iter(corpus))
+    with pytest.raises(ValueError):
+        doc.source_sentences
+    Corpus("test").close()
+
+
+def test_threads_share_archive(tar_path):
+    root = open_root(tar_path)
+    paths = list((DATA_DIR / "gec-fluency" / "test").glob("*/*"))
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        contents = list(executor.map(
+            lambda path: (root / path.relative_to(DATA_DIR).as_posix()).read_bytes(),
+            paths * 4))
+    assert contents == [path.read_bytes() for path in paths * 4]
+    root.archive.close()
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("hello")
+    with pytest.raises(ValueError):
+        open_root(path)
+
+
+def test_pickle(zip_path):
+    corpus = pickle.loads(pickle.dumps(Corpus("test", root=zip_path)))
+    assert corpus.get_doc("1224").source_sentences_tokenized[0] == "Шон Байзель ."
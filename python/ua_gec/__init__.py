@@ -1,3 +1,3 @@
-from .corpus import Corpus, Document, AnnotationLayer
+from .corpus import Corpus, Document, AnnotationLayer, ProjectedCorpus
 from .annotated_text import AnnotatedText
 from .version import __version__
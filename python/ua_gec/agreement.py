@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Inter-annotator agreement on double-annotated documents.
+
+Annotations of the two annotators refer to the same source text, so their
+spans are matched by a sweep over spans sorted by offset. Reported metrics:
+
+- exact span agreement: spans with the same start and end, as the Dice
+  coefficient 2 * matches / (spans_1 + spans_2);
+- overlapping span agreement: the same, counting spans that overlap any span
+  of the other annotator;
+- suggestion agreement: fraction of exactly matched spans with the same top
+  suggestion;
+- Cohen's kappa of error types on exactly matched spans, and per error type
+  (type vs. any other label, where a span missing in one annotation is
+  labeled "none").
+
+Counts are mergeable, so the corpus is processed in one streaming pass,
+optionally split into shards processed in parallel.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+
+NONE = "none"  # label of a span that the other annotator didn't annotate
+
+
+class Agreement:
+    """Mergeable agreement counts of pairs of annotated texts. """
+
+    def __init__(self):
+        self.documents = 0
+        self.skipped = 0  # documents whose annotators' sources differ
+        self.spans = [0, 0]
+        self.exact = 0
+        self.overlapping = [0, 0]
+        self.same_suggestion = 0
+        # (error type of annotator 1, error type of annotator 2) => number
+        # of spans, over the union of both annotators' spans
+        self.labels = collections.Counter()
+
+    def add(self, annotated_1, annotated_2):
+        """Compare annotations of the same source text.
+
+        Raises ValueError if the source texts differ (other than in trailing
+        whitespace).
+        """
+
+        source_1 = annotated_1.get_original_text().rstrip()
+        if source_1 != annotated_2.get_original_text().rstrip():
+            raise ValueError("Annotations of different source texts can't be compared")
+
+        anns_1 = _sorted_spans(annotated_1)
+        anns_2 = _sorted_spans(annotated_2)
+        self.documents += 1
+        self.spans[0] += len(anns_1)
+        self.spans[1] += len(anns_2)
+
+        overlapping_2 = set()
+        for ann_1, matches in zip(anns_1, _sweep(anns_1, anns_2)):
+            if matches:
+                self.overlapping[0] += 1
+                overlapping_2.update(matches)
+        self.overlapping[1] += len(overlapping_2)
+
+        by_span_2 = {(ann.start, ann.end): ann for ann in anns_2}
+        for ann_1 in anns_1:
+            ann_2 = by_span_2.pop((ann_1.start, ann_1.end), None)
+            if ann_2 is None:
+                self.labels[_error_type(ann_1), NONE] += 1
+                continue
+            self.exact += 1
+            self.same_suggestion += ann_1.top_suggestion == ann_2.top_suggestion
+            self.labels[_error_type(ann_1), _error_type(ann_2)] += 1
+        for ann_2 in by_span_2.values():
+            self.labels[NONE, _error_type(ann_2)] += 1
+
+    def merge(self, other):
+        """Add counts of another `Agreement`. Return self. """
+
+        self.documents += other.documents
+        self.skipped += other.skipped
+        self.spans = [a + b for a, b in zip(self.spans, other.spans)]
+        self.exact += other.exact
+        self.overlapping = [a + b for a, b in zip(self.overlapping, other.overlapping)]
+        self.same_suggestion += other.same_suggestion
+        self.labels.update(other.labels)
+        return self
+
+    @property
+    def exact_agreement(self):
+        return _ratio(2 * self.exact, sum(self.spans))
+
+    @property
+    def overlap_agreement(self):
+        return _ratio(sum(self.overlapping), sum(self.spans))
+
+    @property
+    def suggestion_agreement(self):
+        return _ratio(self.same_suggestion, self.exact)
+
+    def error_type_kappa(self):
+        """Cohen's kappa of error types on exactly matched spans. """
+
+        matched = {pair: n for pair, n in self.labels.items() if NONE not in pair}
+        return _kappa(matched)
+
+    def kappa_by_error_type(self):
+        """Return {error type: kappa of the type vs. all other labels}. """
+
+        types = {label for pair in self.labels for label in pair} - {NONE}
+        result = {}
+        for error_type in sorted(types):
+            binary = collections.Counter()
+            for (label_1, label_2), n in self.labels.items():
+                binary[label_1 == error_type, label_2 == error_type] += n
+            result[error_type] = _kappa(binary)
+        return result
+
+    def to_dict(self):
+        return {
+            "Documents": self.documents,
+            "Skipped (different source)": self.skipped,
+            "Spans (annotator 1)": self.spans[0],
+            "Spans (annotator 2)": self.spans[1],
+            "Exact span agreement": _round(self.exact_agreement),
+            "Overlapping span agreement": _round(self.overlap_agreement),
+            "Suggestion agreement": _round(self.suggestion_agreement),
+            "Error type kappa": _round(self.error_type_kappa()),
+            "Error type kappa by type": {
+                error_type: _round(kappa)
+                for error_type, kappa in self.kappa_by_error_type().items()
+            },
+        }
+
+
+def _sorted_spans(annotated):
+    return sorted(annotated.get_annotations(), key=lambda ann: (ann.start, ann.end))
+
+
+def _sweep(anns_1, anns_2):
+    """For every span in `anns_1`, yield indexes of overlapping `anns_2` spans.
+
+    Both lists are sorted and annotations of one annotator never overlap, so
+    end offsets are sorted too and a single forward pointer suffices. Spans
+    overlap if they share a character or are the same (possibly empty) span.
+    """
+
+    first = 0
+    for ann_1 in anns_1:
+        while first < len(anns_2) and anns_2[first].end < ann_1.start:
+            first += 1
+        matches = []
+        i = first
+        while i < len(anns_2) and anns_2[i].start <= ann_1.end:
+            ann_2 = anns_2[i]
+            if (ann_2.start < ann_1.end and ann_1.start < ann_2.end
+                    or (ann_2.start, ann_2.end) == (ann_1.start, ann_1.end)):
+                matches.append(i)
+            i += 1
+        yield matches
+
+
+def _error_type(ann):
+    return ann.meta.get("error_type", "MISSING")
+
+
+def _kappa(pairs):
+    """Cohen's kappa from {(label 1, label 2): count}. """
+
+    total = sum(pairs.values())
+    if not total:
+        return None
+    marginal_1 = collections.Counter()
+    marginal_2 = collections.Counter()
+    observed = 0
+    for (label_1, label_2), n in pairs.items():
+        marginal_1[label_1] += n
+        marginal_2[label_2] += n
+        if label_1 == label_2:
+            observed += n
+    p_observed = observed / total
+    p_expected = sum(marginal_1[l] * marginal_2[l] for l in marginal_1) / total ** 2
+    if p_expected == 1:
+        return 1.0
+    return (p_observed - p_expected) / (1 - p_expected)
+
+
+def _ratio(a, b):
+    return a / b if b else None
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+def iter_document_pairs(corpus):
+    """Yield (annotator 1, annotator 2) documents of double-annotated docs.
+
+    Only double-annotated documents are read, and a document is kept in
+    memory only until the other annotator's version arrives.
+    """
+
+    annotators = collections.defaultdict(set)
+    for meta in corpus._get_metadata():
+        annotators[meta.doc_id].add(meta.annotator_id)
+    double = {doc_id for doc_id, ids in annotators.items() if {1, 2} <= ids}
+
+    pending = {}
+    for doc in corpus.select(double):
+        if doc.meta.annotator_id not in (1, 2):
+            continue
+        other = pending.pop(doc.doc_id, None)
+        if other is None:
+            pending[doc.doc_id] = doc
+        elif doc.meta.annotator_id == 1:
+            yield doc, other
+        else:
+            yield other, doc
+
+
+def compute_agreement(corpus, workers=1):
+    """Return `Agreement` of all double-annotated documents in the corpus. """
+
+    if workers <= 1:
+        return _compute_shard(corpus)
+
+    shards = [corpus.shard(workers, i, balance="bytes") for i in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(_compute_shard, shards)
+
+    agreement = Agreement()
+    for shard_agreement in results:
+        agreement.merge(shard_agreement)
+    return agreement
+
+
+def _compute_shard(corpus):
+    agreement = Agreement()
+    for doc_1, doc_2 in iter_document_pairs(corpus):
+        try:
+            agreement.add(doc_1.annotated, doc_2.annotated)
+        except ValueError:
+            agreement.skipped += 1
+    return agreement
+
+
+def main(args):
+    from ua_gec import Corpus
+    corpus = Corpus(args.partition, args.layer)
+    agreement = compute_agreement(corpus, workers=args.workers)
+    print(json.dumps(agreement.to_dict(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("partition", choices=["all", "train", "test"])
+    parser.add_argument("layer", choices=["gec-fluency", "gec-only"])
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    main(args)
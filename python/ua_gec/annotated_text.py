@@ -227,6 +227,29 @@ class AnnotatedText:
             i += delta + 1
             n_anns = len(self._annotations)
 
+    def filter_annotations(self, predicate):
+        """Return a copy of the text that keeps only matching annotations.
+
+        Unlike `remove`, this leaves the current text intact. Unlike building
+        a new `AnnotatedText` from a string, it doesn't re-parse the markup.
+
+        Example:
+            >>> text = AnnotatedText('{helo=>Hello:::t=a} {wold=>world:::t=b}')
+            >>> text.filter_annotations(lambda a: a.meta['t'] == 'b')
+            <AnnotatedText('helo {wold=>world:::t=b}')>
+
+        Args:
+            predicate (callable): Annotation => bool.
+
+        Returns:
+            AnnotatedText
+        """
+
+        result = object.__new__(type(self))
+        result._text = self._text
+        result._annotations = [a for a in self._annotations if predicate(a)]
+        return result
+
     def get_annotation_at(self, start, end=None):
         """Return annotation at the given position or region.
 
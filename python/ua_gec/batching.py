@@ -0,0 +1,122 @@
+"""Length-bucketed batches of sentence pairs for training GEC models. """
+import random
+
+
+def iter_sentence_pairs(corpus, tokenized=True):
+    """Yield (source, target) sentence pairs of all documents in the corpus.
+
+    Documents annotated by several annotators yield one pair per annotator.
+    """
+
+    for doc in corpus:
+        if tokenized:
+            pairs = zip(doc.source_sentences_tokenized, doc.target_sentences_tokenized)
+        else:
+            pairs = zip(doc.source_sentences, doc.target_sentences)
+        yield from pairs
+
+
+class BatchGenerator:
+    """Stream batches of (source, target) sentence pairs.
+
+    Every epoch reads the documents in a new random order. Pairs are
+    shuffled through a bounded buffer. Within a buffer, pairs are sorted by
+    length and cut into batches whose padded size
+    (`batch size * longest pair`) fits into `max_tokens`. The batches of
+    a buffer are then shuffled again.
+
+    Only the token lengths of the pairs of every document are kept in
+    memory. They are computed while reading the first epoch; later epochs
+    plan each buffer's batches from the lengths alone and then read just
+    the sentence files of the documents in it (annotated files are never
+    parsed). The order of batches only depends on `seed` and the epoch
+    number.
+
+    Args:
+        corpus (Corpus): documents to read sentence pairs from.
+        max_tokens (int): token budget of a batch. A pair longer than
+            the budget forms a batch of its own.
+        buffer_size (int): number of pairs to shuffle and bucket at once.
+        seed (int): random seed.
+        tokenized (bool): whether to use tokenized sentences.
+
+    Example:
+
+        >>> batches = BatchGenerator(Corpus("train"), max_tokens=2048)
+        >>> for epoch in range(3):
+        ...     for batch in batches.iter_epoch(epoch):
+        ...         sources, targets = zip(*batch)
+    """
+
+    def __init__(self, corpus, max_tokens=4096, buffer_size=10000, seed=0,
+                 tokenized=True):
+        if max_tokens < 1 or buffer_size < 1:
+            raise ValueError("`max_tokens` and `buffer_size` must be positive")
+        self.corpus = corpus
+        self.max_tokens = max_tokens
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.tokenized = tokenized
+        self._lengths = {}  # index of a document => lengths of its pairs
+        if tokenized:
+            self._views = ("source-sentences-tokenized", "target-sentences-tokenized")
+        else:
+            self._views = ("source-sentences", "target-sentences")
+
+    def __iter__(self):
+        return self.iter_epoch(0)
+
+    def iter_epoch(self, epoch):
+        """Yield batches (lists of (source, target) pairs) of one epoch. """
+
+        rng = random.Random(f"{self.seed}-{epoch}")
+        order = list(range(len(self.corpus)))
+        rng.shuffle(order)
+
+        # Buffer items are (length, index of a document, index of a pair)
+        buffer = []
+        pairs = {}  # index of a document => its pairs, if already read
+        for i in order:
+            if i not in self._lengths:
+                pairs[i] = self._read_pairs(i)
+                self._lengths[i] = [max(len(s.split()), len(t.split())) for s, t in pairs[i]]
+            for j, length in enumerate(self._lengths[i]):
+                buffer.append((length, i, j))
+                if len(buffer) == self.buffer_size:
+                    yield from self._make_batches(buffer, pairs, rng)
+                    buffer = []
+                    pairs = {i: pairs[i]} if i in pairs else {}
+        if buffer:
+            yield from self._make_batches(buffer, pairs, rng)
+
+    def _read_pairs(self, i):
+        """Return (source, target) pairs of the document with the given index. """
+
+        meta = self.corpus._get_metadata()[i]
+        source, target = (self.corpus._read_view(meta, view) for view in self._views)
+        return list(zip(source, target))
+
+    def _make_batches(self, buffer, pairs, rng):
+        """Return batches of the buffer, reading the pairs not in `pairs`. """
+
+        rng.shuffle(buffer)
+        buffer.sort(key=lambda item: item[0])
+
+        batches = []
+        batch = []
+        max_len = 0
+        for length, i, j in buffer:
+            new_max_len = max(max_len, length)
+            if batch and (len(batch) + 1) * new_max_len > self.max_tokens:
+                batches.append(batch)
+                batch = []
+                new_max_len = length
+            batch.append((i, j))
+            max_len = new_max_len
+        if batch:
+            batches.append(batch)
+
+        rng.shuffle(batches)
+        for i in sorted({i for _, i, _ in buffer} - set(pairs)):
+            pairs[i] = self._read_pairs(i)
+        return [[pairs[i][j] for i, j in batch] for batch in batches]
@@ -0,0 +1,102 @@
+"""Persistent cache of per-sentence processing results.
+
+Parsing and tokenization are the slowest steps of the build scripts, and
+the same sentences are processed many times: sources are shared by both
+layers and annotators, and most target sentences equal their sources.
+`SentenceCache` keeps the results in a sqlite database, keyed by the hash
+of the sentence and a version string of the tool that produced them, so
+every sentence is processed once per tool version.
+"""
+import hashlib
+import os
+import sqlite3
+
+
+class SentenceCache:
+    """A disk-backed mapping of sentence => bytes.
+
+    Args:
+        path (str or Path): sqlite database file. Created if missing.
+        version (str): identifies the tool and its version. Entries written
+            with another version are not visible.
+
+    The cache is safe to use from several processes at once, each with its
+    own `SentenceCache`. Pickled caches reopen the database instead of
+    sharing the connection, but a cache inherited through fork() (e.g., as
+    `initargs` of a pool on Linux) shares it, which sqlite doesn't support:
+    pass the path to the workers and open the cache there.
+
+    Example:
+
+        >>> cache = SentenceCache("cache.sqlite", "tokenizer/1.0")
+        >>> found = cache.get_many(sentences)
+        >>> cache.put_many({s: tokenize(s) for s in sentences if s not in found})
+    """
+
+    def __init__(self, path, version):
+        self.path = str(path)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, value BLOB NOT NULL)"
+            " WITHOUT ROWID")
+        self._db.commit()
+
+    def __reduce__(self):
+        # Reopen in worker processes instead of sharing the connection
+        return type(self), (self.path, self.version)
+
+    def _key(self, sentence):
+        return hashlib.sha256(f"{self.version}\0{sentence}".encode("utf-8")).digest()
+
+    def get_many(self, sentences):
+        """Return {sentence: value} of the cached sentences. """
+
+        keys = {}
+        for sentence in sentences:
+            keys[self._key(sentence)] = sentence
+
+        found = {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), _MAX_PARAMS):
+            chunk = key_list[i:i + _MAX_PARAMS]
+            query = "SELECT key, value FROM cache WHERE key IN ({})".format(
+                ",".join("?" * len(chunk)))
+            for key, value in self._db.execute(query, chunk):
+                found[keys[key]] = value
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, values):
+        """Store {sentence: value}. """
+
+        rows = [(self._key(sentence), value) for sentence, value in values.items()]
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?)", rows)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Sqlite's default limit on the number of query parameters is 999
+_MAX_PARAMS = 900
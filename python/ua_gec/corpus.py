@@ -1,9 +1,13 @@
+import argparse
+import copy
 import csv
 import collections
 import enum
+import heapq
 import pathlib
 
 from ua_gec.annotated_text import AnnotatedText
+from ua_gec.storage import ArchivePath, open_root
 
 
 Metadata = collections.namedtuple(
@@ -80,6 +84,10 @@ class Corpus:
             use all corpus if "all". Default is "train".
         annotation_layer (AnnotationLayer): which annotations to use.
             Defaults to all (grammar and fluency corrections)
+        root (str or Path, optional): where to read the data from: a data
+            directory, or a zip or tar archive of it, which is read without
+            extracting (see `ua_gec.storage`). Defaults to the data bundled
+            with the package.
 
     Example:
 
@@ -87,16 +95,23 @@ class Corpus:
         >>> total_chars = sum(len(doc.source) for doc in corpus)
         >>> print(total_chars)
         1493024
+
+        >>> with Corpus("test", root="ua-gec.zip") as corpus:
+        ...     docs = corpus.get_documents()
     """
 
-    def __init__(self, partition="train", annotation_layer=AnnotationLayer.GecAndFluency):
+    def __init__(self, partition="train", annotation_layer=AnnotationLayer.GecAndFluency,
+                 root=None):
         if partition not in ("train", "test", "all"):
             raise ValueError("`partition` must be 'train', 'test' or 'all'")
         self.partition = partition
         self.annotation_layer = AnnotationLayer(annotation_layer)
 
-        root_dir = pathlib.Path(__file__).parent
-        self._data_dir = root_dir / "data" / self.annotation_layer.value
+        if root is None:
+            self._root = pathlib.Path(__file__).parent / "data"
+        else:
+            self._root = open_root(root)
+        self._data_dir = self._root / self.annotation_layer.value
         self._metadata = None
         self._docs = None  # lazy loaded list of document
 
@@ -110,6 +125,22 @@ class Corpus:
     def __iter__(self):
         return self.iter_documents()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the archive the corpus is read from, if any.
+
+        Corpora returned by `select()` and `shard()` share the archive, so
+        they can't be read after it is closed either.
+        """
+
+        if isinstance(self._root, ArchivePath):
+            self._root.archive.close()
+
     def __len__(self):
         return len(self._get_metadata())
 
@@ -121,7 +152,7 @@ class Corpus:
 
     def _load_metadata(self):
         self._metadata = []
-        path = self._data_dir / ".." / "metadata.csv"
+        path = self._root / "metadata.csv"
         reader = csv.DictReader(path.open(encoding="utf-8"))
         for row in reader:
             if self.partition == "all" or row["partition"] == self.partition:
@@ -149,10 +180,12 @@ class Corpus:
             return iter(self._docs)
 
         # Iterate in a streaming fashion
+        return self._iter_documents()
+
+    def _iter_documents(self):
         for meta in self._get_metadata():
-            filename = f"{meta.doc_id}.a{meta.annotator_id}.ann"
             partition_dir = self._data_dir / meta.partition
-            path = partition_dir / "annotated" / filename
+            path = self._annotated_path(meta)
             text = AnnotatedText(path.read_text(encoding="utf-8"))
             doc = Document(text, meta=meta, partition_dir=partition_dir)
             yield doc
@@ -183,6 +216,177 @@ class Corpus:
         assert len(match) == 1
         return match[0]
 
+    def shard(self, num_shards, index, balance="chars"):
+        """Return one of `num_shards` disjoint parts of the corpus.
+
+        Documents are assigned to shards greedily, heaviest first, which
+        gives shards of roughly equal size. The assignment is deterministic,
+        so every worker computes the same split independently. All
+        annotators of a document end up in the same shard.
+
+        Weights come from a cheap pass over the annotated files; nothing
+        is parsed.
+
+        Args:
+            num_shards (int): total number of shards.
+            index (int): 0-based index of the shard to return.
+            balance (str): what to balance: "chars" (characters in the
+                annotated files), "bytes" (file sizes), or "docs"
+                (number of documents).
+
+        Returns:
+            Corpus with the documents of the selected shard.
+        """
+
+        return self.select(shard_doc_ids([self], num_shards, index, balance))
+
+    def select(self, doc_ids):
+        """Return a corpus with only the given documents (all annotators). """
+
+        doc_ids = set(doc_ids)
+        return self._subset(m for m in self._get_metadata() if m.doc_id in doc_ids)
+
+    def _weight(self, meta, balance):
+        if balance == "docs":
+            return 1
+        path = self._annotated_path(meta)
+        if balance == "bytes":
+            return path.stat().st_size
+        return len(path.read_text(encoding="utf-8"))
+
+    def _subset(self, metadata):
+        """Return a copy of the corpus restricted to the given records. """
+
+        subset = copy.copy(self)
+        subset._metadata = list(metadata)
+        subset._docs = None
+        return subset
+
+    def _annotated_path(self, meta):
+        filename = f"{meta.doc_id}.a{meta.annotator_id}.ann"
+        return self._data_dir / f"{meta.partition}/annotated/{filename}"
+
+    def _view_path(self, meta, view):
+        """Return path of a derived view (e.g., "source-sentences") of a document. """
+
+        if view.startswith("source"):
+            filename = f"{meta.doc_id}.src.txt"
+        else:
+            filename = f"{meta.doc_id}.a{meta.annotator_id}.txt"
+        return self._data_dir / f"{meta.partition}/{view}/{filename}"
+
+    def _read_view(self, meta, view):
+        """Return lines of a derived view of a document without parsing it. """
+
+        text = self._view_path(meta, view).read_text(encoding="utf-8")
+        return text.rstrip("\n").split("\n")
+
     @property
     def data_dir(self):
         return self._data_dir
+
+
+def shard_doc_ids(corpora, num_shards, index, balance="chars"):
+    """Return IDs of the documents in one shard of several corpora.
+
+    Like `Corpus.shard()`, but weights of a document are summed over all
+    corpora (e.g., annotation layers of a partition), so all its versions
+    end up in the same shard.
+    """
+
+    if not 0 <= index < num_shards:
+        raise ValueError(f"Shard index {index} out of range for {num_shards} shards")
+    if balance not in ("chars", "bytes", "docs"):
+        raise ValueError("`balance` must be 'chars', 'bytes' or 'docs'")
+
+    weights = collections.Counter()
+    for corpus in corpora:
+        for meta in corpus._get_metadata():
+            weights[meta.doc_id] += corpus._weight(meta, balance)
+
+    loads = [(0, i) for i in range(num_shards)]
+    selected = set()
+    for doc_id in sorted(weights, key=lambda doc_id: (-weights[doc_id], doc_id)):
+        load, i = heapq.heappop(loads)
+        if i == index:
+            selected.add(doc_id)
+        heapq.heappush(loads, (load + weights[doc_id], i))
+    return selected
+
+
+def parse_shard(value):
+    """Parse a shard spec like "0/4" into (index, num_shards) for `Corpus.shard()`.
+
+    Meant as an argparse `type`; raises argparse.ArgumentTypeError.
+    """
+
+    index, sep, num_shards = value.partition("/")
+    try:
+        index, num_shards = int(index), int(num_shards)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected I/N, got {value!r}")
+    if not (sep and 0 <= index < num_shards):
+        raise argparse.ArgumentTypeError(f"Expected 0 <= I < N, got {value!r}")
+    return index, num_shards
+
+
+def is_gec_only(error_type):
+    """Return True for error types that belong to the gec-only layer. """
+
+    return not error_type.startswith("F/")
+
+
+class ProjectedCorpus(Corpus):
+    """Corpus that keeps only some annotations of another layer.
+
+    Documents are read from `base_layer`, and their annotations are filtered
+    by error type on the fly. Deriving a layer this way costs no extra I/O
+    and no re-parsing. With the default `keep`, the result is the gec-only
+    layer.
+
+    Source-side sentence views are shared with the base layer. Target-side
+    sentence views are not stored for projections, so reading them raises
+    LookupError.
+
+    Args:
+        partition (str): "train", "test" or "all". Default is "train".
+        keep (callable): error_type (str) => bool. Annotations for which
+            it returns False are dropped. Default is `is_gec_only`.
+        base_layer (AnnotationLayer): layer to project. Defaults to
+            grammar and fluency corrections.
+        root (str or Path, optional): see `Corpus`.
+
+    Example:
+
+        >>> corpus = ProjectedCorpus(keep=lambda t: t != "Punctuation")
+        >>> doc = corpus.get_doc("0012")
+    """
+
+    def __init__(self, partition="train", keep=is_gec_only,
+                 base_layer=AnnotationLayer.GecAndFluency, root=None):
+        super().__init__(partition, base_layer, root)
+        self.keep = keep
+
+    def _iter_documents(self):
+        keep = lambda ann: self.keep(ann.meta.get("error_type", ""))
+        for doc in super()._iter_documents():
+            yield _ProjectedDocument(
+                doc.annotated.filter_annotations(keep),
+                meta=doc.meta,
+                partition_dir=doc._partition_dir)
+
+    def _read_view(self, meta, view):
+        if view.startswith("target"):
+            raise LookupError("Target sentences are not stored for projections")
+        return super()._read_view(meta, view)
+
+
+class _ProjectedDocument(Document):
+
+    @property
+    def target_sentences(self):
+        raise LookupError("Target sentences are not stored for projections")
+
+    @property
+    def target_sentences_tokenized(self):
+        raise LookupError("Target sentences are not stored for projections")
@@ -0,0 +1,216 @@
+"""Precomputed per-document counts.
+
+The index stores the number of source sentences, tokens, characters, and
+annotations by error type for every document and annotator. It is kept in
+`<layer>/<partition>/count_index.json`, next to the postprocessing manifest,
+together with the hashes of the annotated files and tokenized source
+sentences it was computed from, and their sizes and mtimes. When the index
+is loaded, only files whose size or mtime changed are hashed again, and
+only documents whose hashes changed are recounted.
+
+Indexes are only saved on request (`save=True`, `--save-index` of the
+stats scripts), since the data directory may be read-only, e.g. in an
+installed package.
+"""
+import collections
+import json
+import os
+import pathlib
+import warnings
+
+from ua_gec.corpus import ProjectedCorpus
+from ua_gec.manifest import Manifest, make_key, parse_key
+
+INDEX_NAME = "count_index.json"
+
+# Derived views read by `count_document()`
+COUNTED_VIEWS = ("source-sentences-tokenized",)
+
+DocCounts = collections.namedtuple("DocCounts", "sentences tokens chars errors")
+
+
+class CountIndex:
+    """Counts of every document in a corpus.
+
+    Args:
+        layer (str): annotation layer of the counted documents.
+        manifest (Manifest): hashes of the annotated files that were counted.
+        counts (dict): manifest key => DocCounts.
+
+    Example:
+
+        >>> index = CountIndex.for_corpus(Corpus("all"))
+        >>> index.get(doc.meta).tokens
+    """
+
+    VERSION = "counts/2"
+
+    def __init__(self, layer, manifest, counts):
+        self.layer = layer
+        self.manifest = manifest
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get(self, meta):
+        """Return DocCounts of the document with the given metadata. """
+
+        return self.counts[make_key(self.layer, meta)]
+
+    @classmethod
+    def build(cls, corpus, previous=None):
+        """Count all documents in the corpus in a single pass.
+
+        Counts of documents that didn't change since `previous` (a
+        `CountIndex`) are reused.
+        """
+
+        layer = corpus.annotation_layer.value
+        old_manifest = previous.manifest if previous else None
+        manifest = Manifest.build(corpus, cls.VERSION, views=COUNTED_VIEWS,
+                                  previous=old_manifest)
+        changed = manifest.changed_keys(old_manifest) & set(manifest.hashes)
+
+        counts = {}
+        for key in manifest.hashes:
+            if key not in changed:
+                counts[key] = previous.counts[key]
+
+        changed_ids = {parse_key(key)[1] for key in changed}
+        for doc in corpus.select(changed_ids):
+            key = make_key(layer, doc.meta)
+            if key in changed:
+                counts[key] = count_document(doc)
+
+        return cls(layer, manifest, counts)
+
+    @classmethod
+    def for_corpus(cls, corpus, save=False):
+        """Load the stored indexes of the corpus, updating them if needed.
+
+        If `save` is True, updated indexes are saved back next to the data
+        (see `save_for_corpus()`); never for data read from an archive.
+        Indexes of projections are always built from scratch, because their
+        annotation counts differ from the stored layer.
+        """
+
+        previous = [cls.load(path) for path in _stored_paths(corpus).values()]
+        index = cls.build(corpus, cls.merge(corpus.annotation_layer.value, previous))
+        if save:
+            index.save_for_corpus(corpus)
+        return index
+
+    def save_for_corpus(self, corpus):
+        """Add counts of the corpus documents to the stored indexes.
+
+        Entries of other documents in the stored indexes are kept, so it is
+        safe to save indexes built for a shard of the corpus. If the data
+        directory isn't writable, a warning is issued instead.
+        """
+
+        keys_by_partition = collections.defaultdict(set)
+        for meta in corpus._get_metadata():
+            keys_by_partition[meta.partition].add(make_key(self.layer, meta))
+
+        for partition, path in _stored_paths(corpus).items():
+            stored = self.load(path)
+            keys = keys_by_partition[partition] & set(self.counts)
+            updated = self.merge(self.layer, [stored, self._select(keys)])
+            if not updated._same_as(stored):
+                try:
+                    updated.save(path)
+                except OSError as e:
+                    warnings.warn(f"Can't save the count index: {e}")
+
+    @classmethod
+    def merge(cls, layer, indexes):
+        """Combine indexes of disjoint sets of documents.
+
+        `None`s and indexes built by another version are skipped.
+        """
+
+        hashes = {}
+        stats = {}
+        counts = {}
+        for index in indexes:
+            if index is not None and index.manifest.tool_version == cls.VERSION:
+                hashes.update(index.manifest.hashes)
+                stats.update(index.manifest.stats)
+                counts.update(index.counts)
+        return cls(layer, Manifest(cls.VERSION, hashes, stats), counts)
+
+    def _select(self, keys):
+        hashes = {key: self.manifest.hashes[key] for key in keys}
+        stats = {key: self.manifest.stats[key] for key in keys if key in self.manifest.stats}
+        counts = {key: self.counts[key] for key in keys}
+        manifest = Manifest(self.manifest.tool_version, hashes, stats)
+        return CountIndex(self.layer, manifest, counts)
+
+    def _same_as(self, other):
+        return (other is not None
+                and self.layer == other.layer
+                and self.manifest == other.manifest
+                and self.manifest.stats == other.manifest.stats
+                and self.counts == other.counts)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with `save()`. Return None if it doesn't exist. """
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        manifest = Manifest(data["tool_version"], data["hashes"], data.get("stats"))
+        counts = {key: DocCounts(*value) for key, value in data["counts"].items()}
+        return cls(data["layer"], manifest, counts)
+
+    def save(self, path):
+        """Write the index atomically. """
+
+        data = {
+            "layer": self.layer,
+            "tool_version": self.manifest.tool_version,
+            "hashes": self.manifest.hashes,
+            "stats": self.manifest.stats,
+            "counts": {key: list(value) for key, value in self.counts.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp_path, path)
+
+
+def count_document(doc):
+    """Return DocCounts of a single document. """
+
+    sentences = doc.source_sentences_tokenized
+    errors = collections.Counter()
+    for ann in doc.annotated.get_annotations():
+        errors[ann.meta.get("error_type", "MISSING")] += 1
+
+    return DocCounts(
+        sentences=sum(1 for s in sentences if s.strip()),
+        tokens=sum(len(s.split()) for s in sentences),
+        chars=len(doc.source),
+        errors=dict(errors),
+    )
+
+
+def _stored_paths(corpus):
+    """Return paths of the stored indexes of the corpus by partition.
+
+    Archives and projections have no stored indexes.
+    """
+
+    if not isinstance(corpus.data_dir, pathlib.Path):
+        return {}
+    if isinstance(corpus, ProjectedCorpus):
+        return {}
+
+    partitions = {meta.partition for meta in corpus._get_metadata()}
+    return {p: corpus.data_dir / p / INDEX_NAME for p in sorted(partitions)}
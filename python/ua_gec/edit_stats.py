@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""Extended edit statistics.
+
+Computes distributions of edit lengths (source vs. suggestion), fractions of
+insertions, deletions and replacements, errors per 1k tokens by metadata
+breakdown, and co-occurrence of error types within sentences.
+
+Annotations are first extracted into columns, one row per annotation. The
+columns are aggregated with NumPy if it is installed, and in pure Python
+otherwise. Both give the same results.
+"""
+import argparse
+import bisect
+import collections
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ua_gec.count_index import CountIndex
+from ua_gec.stats import BREAKDOWNS
+
+EDIT_KINDS = ("insertion", "deletion", "replacement", "no_suggestion")
+
+
+class AnnotationColumns:
+    """Columnar extract of the annotations of a corpus.
+
+    Per-document columns are indexed by record (document and annotator):
+    `records` (Metadata) and `tokens` (number of source tokens).
+
+    Per-annotation columns hold ints, one per annotation: `record`,
+    `sentence` (index of the source sentence), `error_type` (index into
+    `error_types`), `source_len` and `suggestion_len` (in whitespace tokens),
+    and `kind` (index into `EDIT_KINDS`).
+    """
+
+    def __init__(self):
+        self.records = []
+        self.tokens = []
+        self.error_types = []
+        self.record = []
+        self.sentence = []
+        self.error_type = []
+        self.source_len = []
+        self.suggestion_len = []
+        self.kind = []
+
+    def __len__(self):
+        return len(self.record)
+
+
+def extract_columns(corpus, index=None):
+    """Extract annotations of all documents in the corpus into columns. """
+
+    if index is None:
+        index = CountIndex.for_corpus(corpus)
+
+    columns = AnnotationColumns()
+    type_ids = {}
+    for doc in corpus:
+        record = len(columns.records)
+        columns.records.append(doc.meta)
+        columns.tokens.append(index.get(doc.meta).tokens)
+
+        annotations = sorted(doc.annotated.get_annotations(), key=lambda a: a.start)
+        sentences = _locate_sentences(doc, [ann.start for ann in annotations])
+        for ann, sentence in zip(annotations, sentences):
+            error_type = ann.meta.get("error_type", "MISSING")
+            if error_type not in type_ids:
+                type_ids[error_type] = len(columns.error_types)
+                columns.error_types.append(error_type)
+
+            suggestion = ann.top_suggestion
+            if suggestion is None:
+                kind = "no_suggestion"
+            elif not ann.source_text:
+                kind = "insertion"
+            elif not suggestion:
+                kind = "deletion"
+            else:
+                kind = "replacement"
+
+            columns.record.append(record)
+            columns.sentence.append(sentence)
+            columns.error_type.append(type_ids[error_type])
+            columns.source_len.append(len(ann.source_text.split()))
+            columns.suggestion_len.append(len((suggestion or "").split()))
+            columns.kind.append(EDIT_KINDS.index(kind))
+
+    return columns
+
+
+def _locate_sentences(doc, positions):
+    """Return source sentence index for each of the sorted `positions`.
+
+    Sentence files may join sentences with spaces where the source has
+    newlines, so sentences are matched by counting non-whitespace characters.
+    """
+
+    ends = []
+    total = 0
+    for sentence in doc.source_sentences:
+        total += len("".join(sentence.split()))
+        ends.append(total)
+
+    result = []
+    source = doc.source
+    prev = 0
+    count = 0  # non-whitespace characters in source[:prev]
+    for pos in positions:
+        count += len("".join(source[prev:pos].split()))
+        prev = pos
+        result.append(min(bisect.bisect_right(ends, count), len(ends) - 1))
+    return result
+
+
+def compute_edit_stats(columns, use_numpy=None):
+    """Aggregate annotation columns into a JSON-serializable dict.
+
+    Args:
+        columns (AnnotationColumns): extracted annotations.
+        use_numpy (bool, optional): force or disable NumPy. By default,
+            NumPy is used if it is installed.
+    """
+
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        aggregates = _aggregate_numpy(columns)
+    else:
+        aggregates = _aggregate_python(columns)
+    source_hist, suggestion_hist, kind_counts, ann_counts, cooccurrence = aggregates
+
+    num_annotations = len(columns)
+    stats = {}
+    stats["Annotations"] = num_annotations
+    stats["Edit length (tokens)"] = {
+        "source": source_hist,
+        "suggestion": suggestion_hist,
+    }
+    stats["Edit kinds"] = {
+        kind: {
+            "count": count,
+            "fraction": round(count / num_annotations, 4) if num_annotations else 0.0,
+        }
+        for kind, count in zip(EDIT_KINDS, kind_counts)
+    }
+    stats["Errors per 1k tokens"] = _density(columns, ann_counts)
+    stats["Error type co-occurrence (sentences)"] = {
+        columns.error_types[a]: {
+            columns.error_types[b]: n for b, n in sorted(row.items(), key=_by_type(columns))
+        }
+        for a, row in sorted(cooccurrence.items(), key=_by_type(columns))
+    }
+    return stats
+
+
+def _by_type(columns):
+    return lambda item: columns.error_types[item[0]]
+
+
+def _density(columns, ann_counts):
+    """Errors per 1k tokens overall and by `BREAKDOWNS`. """
+
+    groups = collections.defaultdict(lambda: [0, 0])  # (title, value) => [errors, tokens]
+    for meta, tokens, errors in zip(columns.records, columns.tokens, ann_counts):
+        keys = [("Total", "All")] + [(title, getattr(meta, field)) for title, field in BREAKDOWNS]
+        for key in keys:
+            groups[key][0] += errors
+            groups[key][1] += tokens
+
+    result = {}
+    for title in ["Total"] + [title for title, _ in BREAKDOWNS]:
+        values = sorted(value for t, value in groups if t == title and value != "")
+        result[title] = {}
+        for value in values:
+            errors, tokens = groups[title, value]
+            result[title][value] = round(1000 * errors / tokens, 3) if tokens else 0.0
+    return result
+
+
+def _aggregate_python(columns):
+    source_hist = collections.Counter(columns.source_len)
+    suggestion_hist = collections.Counter(columns.suggestion_len)
+    kinds = collections.Counter(columns.kind)
+    kind_counts = [kinds[i] for i in range(len(EDIT_KINDS))]
+
+    ann_counts = [0] * len(columns.records)
+    for record in columns.record:
+        ann_counts[record] += 1
+
+    types_by_sentence = collections.defaultdict(set)
+    for record, sentence, error_type in zip(columns.record, columns.sentence, columns.error_type):
+        types_by_sentence[record, sentence].add(error_type)
+
+    cooccurrence = collections.defaultdict(collections.Counter)
+    for types in types_by_sentence.values():
+        for a in types:
+            for b in types:
+                cooccurrence[a][b] += 1
+
+    return (
+        _histogram(source_hist),
+        _histogram(suggestion_hist),
+        kind_counts,
+        ann_counts,
+        cooccurrence,
+    )
+
+
+def _aggregate_numpy(columns):
+    record = np.asarray(columns.record, dtype=np.int64)
+    sentence = np.asarray(columns.sentence, dtype=np.int64)
+    error_type = np.asarray(columns.error_type, dtype=np.int64)
+
+    source_hist = np.bincount(np.asarray(columns.source_len, dtype=np.int64))
+    suggestion_hist = np.bincount(np.asarray(columns.suggestion_len, dtype=np.int64))
+    kind_counts = np.bincount(np.asarray(columns.kind, dtype=np.int64), minlength=len(EDIT_KINDS))
+    ann_counts = np.bincount(record, minlength=len(columns.records))
+
+    # Sentence-by-type incidence matrix; co-occurrence is its Gram matrix
+    num_types = len(columns.error_types)
+    cooccurrence = {}
+    if len(record):
+        sentence_key = record * (sentence.max() + 1) + sentence
+        _, sentence_ids = np.unique(sentence_key, return_inverse=True)
+        incidence = np.zeros((sentence_ids.max() + 1, num_types), dtype=np.int64)
+        incidence[sentence_ids, error_type] = 1
+        gram = incidence.T @ incidence
+        for a, b in zip(*np.nonzero(gram)):
+            cooccurrence.setdefault(int(a), {})[int(b)] = int(gram[a, b])
+
+    return (
+        _histogram(dict(enumerate(source_hist.tolist()))),
+        _histogram(dict(enumerate(suggestion_hist.tolist()))),
+        kind_counts.tolist(),
+        ann_counts.tolist(),
+        cooccurrence,
+    )
+
+
+def _histogram(counts):
+    """Return {str(length): count} for non-zero counts, sorted by length. """
+
+    return {str(k): counts[k] for k in sorted(counts) if counts[k]}
+
+
+def main(args):
+    from ua_gec import Corpus
+    corpus = Corpus(args.partition, args.layer)
+    index = CountIndex.for_corpus(corpus, save=args.save_index)
+    stats = compute_edit_stats(extract_columns(corpus, index))
+    text = json.dumps(stats, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("partition", choices=["all", "train", "test"])
+    parser.add_argument("layer", choices=["gec-fluency", "gec-only"])
+    parser.add_argument("--output", help="JSON file to write (default: stdout)")
+    parser.add_argument("--save-index", action="store_true",
+                        help="save the updated count index next to the data")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,249 @@
+"""Read and write M2 files.
+
+M2 files of UA-GEC have a heading block before every document:
+
+    S # 0123
+    A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0
+    A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||1
+
+`M2Writer` writes files one document at a time. `M2Reader` gives random
+access to sentences and documents of a file through an index of byte
+offsets, without loading the whole file.
+
+A sentence that is a single token starting with `#` and has no edits looks
+exactly like a heading (e.g., `S # генетичні_хвороби`). Pass the expected
+doc_ids to `M2Reader` to tell them apart.
+"""
+import bisect
+import collections
+import os
+import re
+
+M2Edit = collections.namedtuple("M2Edit", "o_start o_end type correction annotator_id")
+M2Sentence = collections.namedtuple("M2Sentence", "source edits doc_id")
+
+HEADING_PATTERN = re.compile(r"S # (\S+)\n")
+
+
+def noop_edit(annotator_id=0):
+    return f"A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||{annotator_id}"
+
+
+def doc_heading(doc_id):
+    """Return the heading block of a document. """
+
+    return f"S # {doc_id}\n{noop_edit(0)}\n{noop_edit(1)}\n\n"
+
+
+def parse_edit(line):
+    """Parse an `A ...` line into M2Edit. """
+
+    span, error_type, correction, _, _, annotator_id = line[2:].rstrip("\n").split("|||")
+    o_start, o_end = span.split()
+    return M2Edit(int(o_start), int(o_end), error_type, correction, int(annotator_id))
+
+
+class M2Writer:
+    """Write an M2 file one document at a time.
+
+    Each document is flushed as soon as it's written. The file is written
+    under a temporary name and moved into place by `close()`, so readers
+    never see a partial file; if the writer is used as a context manager
+    and an exception occurs, the old file is left untouched.
+
+    Example:
+
+        >>> with M2Writer("test.m2") as writer:
+        ...     writer.write(m2_of_document)
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._tmp_path = f"{self.path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+
+    def write(self, block):
+        """Write M2 text of a document, including its heading. """
+
+        self._file.write(block)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class M2Reader:
+    """Lazy access to an M2 file.
+
+    The first random access scans the file once and records byte offsets of
+    all `S` blocks, including document headings. Iteration streams the file
+    and doesn't need the index.
+
+    Sentences are numbered from 0 in the order of the file, headings
+    included. A block is a heading only if it's exactly `doc_heading()`
+    of its doc_id and, if `doc_ids` (collection of the IDs expected in the
+    file) is given, the doc_id is one of them.
+    """
+
+    def __init__(self, path, doc_ids=None):
+        self.path = str(path)
+        self._expected = None if doc_ids is None else set(doc_ids)
+        self._file = open(self.path, "rb")
+        self._offsets = None  # byte offset of every block, plus the file size
+        self._doc_starts = None  # doc_id => index of its heading block
+        self._headings = None  # sorted indexes of heading blocks
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _build_index(self):
+        if self._offsets is not None:
+            return
+
+        self._offsets = []
+        self._doc_starts = {}
+        self._headings = []
+        self._file.seek(0)
+        for offset, block in _iter_blocks(self._file, b"S "):
+            if block.startswith(b"S # "):
+                doc_id = self._heading_doc_id(block.decode("utf-8"))
+                if doc_id is not None:
+                    self._doc_starts[doc_id] = len(self._offsets)
+                    self._headings.append(len(self._offsets))
+            self._offsets.append(offset)
+        self._offsets.append(self._file.seek(0, os.SEEK_END))
+
+    def _heading_doc_id(self, block):
+        """Return doc_id if the block is a document heading, else None. """
+
+        match = HEADING_PATTERN.match(block)
+        if match is None or block != doc_heading(match.group(1)):
+            return None
+        if self._expected is not None and match.group(1) not in self._expected:
+            return None
+        return match.group(1)
+
+    def __len__(self):
+        self._build_index()
+        return len(self._offsets) - 1
+
+    def doc_ids(self):
+        """Return doc_ids in the order of the file. """
+
+        self._build_index()
+        return sorted(self._doc_starts, key=self._doc_starts.get)
+
+    def sentence(self, index):
+        """Return M2Sentence number `index`. """
+
+        self._build_index()
+        if not 0 <= index < len(self):
+            raise IndexError(f"Sentence {index} out of range")
+        text = self._read(index, index + 1)
+        doc_id = None
+        i = bisect.bisect_right(self._headings, index) - 1
+        if i >= 0:
+            doc_id = HEADING_PATTERN.match(self._read(self._headings[i], self._headings[i] + 1))[1]
+        return _parse_block(text, doc_id)
+
+    def document(self, doc_id):
+        """Return M2Sentences of a document, without its heading. """
+
+        start, end = self._doc_range(doc_id)
+        return [_parse_block(block, doc_id) for block in _split_blocks(self._read(start + 1, end))]
+
+    def document_text(self, doc_id):
+        """Return M2 text of a document, including its heading. """
+
+        return self._read(*self._doc_range(doc_id))
+
+    def _doc_range(self, doc_id):
+        self._build_index()
+        try:
+            start = self._doc_starts[doc_id]
+        except KeyError:
+            raise LookupError(f"Document {doc_id} not found in {self.path}")
+        i = bisect.bisect_right(self._headings, start)
+        end = self._headings[i] if i < len(self._headings) else len(self)
+        return start, end
+
+    def _read(self, start, end):
+        """Return text of blocks [start, end). """
+
+        self._file.seek(self._offsets[start])
+        return self._file.read(self._offsets[end] - self._offsets[start]).decode("utf-8")
+
+    def __iter__(self):
+        """Iterate over M2Sentences, headings included. """
+
+        doc_id = None
+        with open(self.path, encoding="utf-8") as f:
+            for _, block in _iter_blocks(f, "S "):
+                doc_id = self._heading_doc_id(block) or doc_id
+                yield _parse_block(block, doc_id)
+
+    def iter_edits(self):
+        """Iterate over all M2Edits of the file, including noop edits. """
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("A "):
+                    yield parse_edit(line)
+
+
+def _iter_blocks(lines, prefix):
+    """Yield (offset, text) of blocks that start with `prefix` lines.
+
+    Offsets are in the units of `lines` (bytes or characters).
+    """
+
+    start = None
+    block = []
+    offset = 0
+    for line in lines:
+        if line.startswith(prefix):
+            if start is not None:
+                yield start, block[0][:0].join(block)
+            start = offset
+            block = []
+        block.append(line)
+        offset += len(line)
+    if start is not None:
+        yield start, block[0][:0].join(block)
+
+
+def _split_blocks(text):
+    blocks = []
+    for line in text.splitlines(keepends=True):
+        if line.startswith("S ") or not blocks:
+            blocks.append(line)
+        else:
+            blocks[-1] += line
+    return blocks
+
+
+def _parse_block(text, doc_id):
+    lines = text.splitlines()
+    source = lines[0][2:] if lines and lines[0].startswith("S ") else ""
+    edits = [parse_edit(line) for line in lines[1:] if line.startswith("A ")]
+    return M2Sentence(source, edits, doc_id)
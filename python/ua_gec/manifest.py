@@ -0,0 +1,157 @@
+"""Content hashes of annotated documents.
+
+Tools that derive views from the annotated data (sentence splits, M2 files,
+statistics) save a manifest next to their output. On the next run, they
+compare it with the current state of the data and only reprocess documents
+that changed.
+"""
+import hashlib
+import json
+import os
+import pathlib
+
+
+class Manifest:
+    """Map every annotated document to the SHA-256 of its `.ann` file and
+    the derived views that a tool reads.
+
+    Keys look like "gec-fluency/0042.a1" (layer, doc_id, annotator_id).
+
+    Args:
+        tool_version (str): version of the tool that produced the output.
+            If it changes, all documents are considered changed.
+        hashes (dict, optional): key => hex digest.
+        stats (dict, optional): key => [size, mtime_ns] (or None if missing)
+            of the hashed files, used to skip hashing unchanged files.
+
+    Example:
+
+        >>> old = Manifest.load("out.m2.manifest.json")
+        >>> new = Manifest.build(corpus, tool_version="make_m2/1")
+        >>> changed = new.changed_doc_ids(old)
+        >>> ... # reprocess `changed`
+        >>> new.save("out.m2.manifest.json")
+    """
+
+    def __init__(self, tool_version, hashes=None, stats=None):
+        self.tool_version = tool_version
+        self.hashes = dict(hashes or {})
+        self.stats = dict(stats or {})
+
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return self.tool_version == other.tool_version and self.hashes == other.hashes
+
+    def __repr__(self):
+        return "<Manifest(tool_version={!r}, len={} docs)>".format(
+            self.tool_version, len(self.hashes))
+
+    @classmethod
+    def build(cls, corpus, tool_version, views=(), previous=None):
+        """Hash the annotated files of all documents in the corpus.
+
+        Tools that read derived views (e.g., "source-sentences-tokenized")
+        pass their names in `views`, so that a document's hash also covers
+        these files and changes when they are regenerated.
+
+        If `previous` (a Manifest of the same tool version) is given, the
+        hash of a document whose files have the same size and mtime as
+        recorded in it is reused without reading the files. Stats are only
+        recorded for a data directory, not for archives.
+        """
+
+        if previous is not None and previous.tool_version != tool_version:
+            previous = None
+        use_stats = isinstance(corpus.data_dir, pathlib.Path)
+
+        hashes = {}
+        stats = {}
+        layer = corpus.annotation_layer.value
+        for meta in corpus._get_metadata():
+            key = make_key(layer, meta)
+            paths = [corpus._annotated_path(meta)]
+            paths += [corpus._view_path(meta, view) for view in views]
+            if use_stats:
+                stats[key] = [_stat(path) for path in paths]
+                if (previous is not None and key in previous.hashes
+                        and previous.stats.get(key) == stats[key]):
+                    hashes[key] = previous.hashes[key]
+                    continue
+
+            digest = hashlib.sha256(paths[0].read_bytes())
+            for view, path in zip(views, paths[1:]):
+                view_hash = hashlib.sha256(path.read_bytes()).digest() if path.exists() else b""
+                digest.update(f"\0{view}\0".encode("utf-8") + view_hash)
+            hashes[key] = digest.hexdigest()
+
+        return cls(tool_version, hashes, stats)
+
+    @classmethod
+    def load(cls, path):
+        """Load a manifest saved with `save()`. Return None if it doesn't exist. """
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        return cls(data["tool_version"], data["hashes"], data.get("stats"))
+
+    def save(self, path):
+        """Write the manifest atomically. """
+
+        data = {"tool_version": self.tool_version, "hashes": self.hashes}
+        if self.stats:
+            data["stats"] = self.stats
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp_path, path)
+
+    def changed_keys(self, old):
+        """Return keys that were added, modified or removed since `old`.
+
+        Everything is considered changed if `old` is None or was produced
+        by a different tool version.
+        """
+
+        if old is None or old.tool_version != self.tool_version:
+            keys = set(self.hashes)
+            if old is not None:
+                keys |= set(old.hashes)
+            return keys
+
+        keys = set(self.hashes) | set(old.hashes)
+        return {k for k in keys if self.hashes.get(k) != old.hashes.get(k)}
+
+    def changed_doc_ids(self, old):
+        """Return IDs of documents with any annotator changed since `old`. """
+
+        return {parse_key(key)[1] for key in self.changed_keys(old)}
+
+
+def _stat(path):
+    """Return [size, mtime_ns] of a file, or None if it doesn't exist. """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def make_key(layer, meta):
+    """Return manifest key for a document's metadata. """
+
+    return f"{layer}/{meta.doc_id}.a{meta.annotator_id}"
+
+
+def parse_key(key):
+    """Return (layer, doc_id, annotator_id) of a manifest key. """
+
+    layer, _, name = key.partition("/")
+    doc_id, _, annotator = name.rpartition(".a")
+    return layer, doc_id, int(annotator)
@@ -1,42 +1,157 @@
 #!/usr/bin/env python3
 import argparse
 import collections
+import multiprocessing
 
-from functools import cache
+from ua_gec.count_index import CountIndex
+
+# (title, metadata field) of statistics breakdowns
+BREAKDOWNS = [
+    ("By gender", "gender"),
+    ("By region", "region"),
+    ("By native", "is_native"),
+    ("By occupation", "occupation"),
+    ("By submission type", "submission_type"),
+    ("By translation lang", "source_language"),
+]
+
+
+class SubsetCounter:
+    """Mergeable counts of a subset of documents. """
+
+    def __init__(self):
+        self.documents = 0
+        self.sentences = 0
+        self.tokens = 0
+        self.authors = set()
+
+    def add(self, meta, counts):
+        """Count a single document given its metadata and `DocCounts`. """
+
+        self.documents += 1
+        self.sentences += counts.sentences
+        self.tokens += counts.tokens
+        self.authors.add(meta.author_id)
+
+    def merge(self, other):
+        """Add counts of another `SubsetCounter`. """
+
+        self.documents += other.documents
+        self.sentences += other.sentences
+        self.tokens += other.tokens
+        self.authors |= other.authors
+
+    def to_dict(self):
+        return {
+            "Documents": self.documents,
+            "Sentences": self.sentences,
+            "Tokens": self.tokens,
+            "Unique users": len(self.authors),
+        }
+
+
+class PartialStats:
+    """Mergeable statistics of a part of the corpus.
+
+    Partial stats of disjoint parts (e.g., corpus shards processed in
+    different processes) can be combined with `merge` in any order.
+    """
+
+    def __init__(self):
+        self.subsets = collections.defaultdict(SubsetCounter)  # (title, value) => counts
+        self.errors = collections.Counter()
+
+    def add(self, meta, counts):
+        """Count a single document given its metadata and `DocCounts`. """
+
+        # Count unique source docs only
+        if meta.annotator_id == 1:
+            self.subsets["Total", "All"].add(meta, counts)
+            for title, field in BREAKDOWNS:
+                self.subsets[title, getattr(meta, field)].add(meta, counts)
+
+        # Errors are counted for all annotators
+        self.errors.update(counts.errors)
+        self.errors["TOTAL"] += sum(n for t, n in counts.errors.items() if t != "MISSING")
+
+    def merge(self, other):
+        """Add another `PartialStats` to this one and return self. """
+
+        for key, subset in other.subsets.items():
+            self.subsets[key].merge(subset)
+        self.errors.update(other.errors)
+        return self
+
+    def to_stats(self):
+        """Return statistics in the `CorpusStatistics.stats` format. """
+
+        values_by_title = collections.defaultdict(list)
+        for title, value in self.subsets:
+            values_by_title[title].append(value)
+
+        stats = {}
+        for title in ["Total"] + [title for title, _ in BREAKDOWNS]:
+            stats[title] = {
+                value: self.subsets[title, value].to_dict()
+                for value in sorted(values_by_title[title])
+            }
+        stats["Number of errors (by 2 annotators)"] = dict(sorted(self.errors.items()))
+        stats['By translation lang'].pop('', None)
+        return stats
 
 
 class CorpusStatistics:
-    """Compute corpus statistics. """
+    """Compute corpus statistics.
+
+    Per-document counts are read from the precomputed `CountIndex`, which is
+    updated first if some documents changed.
 
-    def __init__(self, corpus):
+    Args:
+        corpus (Corpus): documents to compute statistics for.
+        index (CountIndex, optional): counts to use. Defaults to the index
+            stored next to the corpus data.
+        workers (int): number of processes. Each one builds the partial
+            statistics (and, if needed, the count index) of a corpus shard.
+        save_index (bool): save the updated default index next to the data.
+    """
+
+    def __init__(self, corpus, index=None, workers=1, save_index=False):
         self.corpus = corpus
+        self.index = index
+        self.workers = workers
+        self.save_index = save_index
         self.stats = {}
         self.layer = self.corpus.annotation_layer.value
         self.compute()
 
     def compute(self):
-        all_docs = self.corpus.get_documents()  # annotated by all annotators
-        docs = [doc for doc in all_docs if doc.meta.annotator_id == 1]  # unique source docs
-
-        self.stats["Total"] = {}
-        self.stats["Total"]["All"] = self._subset_stats(docs)
-        self.stats["By gender"] = self._breakdown(docs, "gender")
-        self.stats["By region"] = self._breakdown(docs, "region")
-        self.stats["By native"] = self._breakdown(docs, "is_native")
-        self.stats["By occupation"] = self._breakdown(docs, "occupation")
-        self.stats["By submission type"] = self._breakdown(docs, "submission_type")
-        self.stats["By translation lang"] = self._breakdown(docs, "source_language")
-        self.stats["Number of errors (by 2 annotators)"] = self._count_errors(all_docs)
-        del self.stats['By translation lang']['']
-
-    def _subset_stats(self, docs):
-        stats = {}
-        stats["Documents"] = len(docs)
-        stats["Sentences"] = sum(self.count_source_sentences(doc) for doc in docs)
-        stats["Tokens"] = sum(self.count_tokens(doc) for doc in docs)
-        stats["Unique users"] = len(set(doc.meta.author_id for doc in docs))
-
-        return stats
+        if self.workers > 1:
+            partial = self._compute_parallel()
+        else:
+            if self.index is None:
+                self.index = CountIndex.for_corpus(self.corpus, save=self.save_index)
+            partial = compute_partial_stats(self.corpus, self.index)[0]
+
+        self.stats.update(partial.to_stats())
+
+    def _compute_parallel(self):
+        shards = [self.corpus.shard(self.workers, i, balance="bytes")
+                  for i in range(self.workers)]
+        with multiprocessing.Pool(self.workers) as pool:
+            results = pool.starmap(
+                compute_partial_stats,
+                [(shard, self.index) for shard in shards])
+
+        partial = PartialStats()
+        for shard_partial, _ in results:
+            partial.merge(shard_partial)
+
+        if self.index is None:
+            self.index = CountIndex.merge(self.layer, [index for _, index in results])
+            if self.save_index:
+                self.index.save_for_corpus(self.corpus)
+
+        return partial
 
     def reset_stats(self):
         pass
@@ -48,58 +163,27 @@ class CorpusStatistics:
                 print(f"{key:<30} {value}")
             print()
 
-    @cache
-    def count_source_sentences(self, doc):
-        with open(f"./data/{self.layer}/{doc.meta.partition}/source-sentences-tokenized/{doc.doc_id}.src.txt") as f:
-            content = f.read()
-            sents = [s for s in content.split("\n") if s.strip()]
-            return len(sents)
-
-    @cache
-    def count_tokens(self, doc):
-        with open(f"./data/{self.layer}/{doc.meta.partition}/source-sentences-tokenized/{doc.doc_id}.src.txt") as f:
-            content = f.read()
-            tokens = content.split()
-            return len(tokens)
-
-    def _breakdown(self, docs, field):
-        """Compute statistics with breakdown by `field`.
-
-        Returns:
-            dict: field_class (str) => stats (dict[str, int])
-        """
-
-        result = {}
-        values = sorted({getattr(doc.meta, field) for doc in docs})
-
-        for value in values:
-            subset = [doc for doc in docs if getattr(doc.meta, field) == value]
-            result[value] = self._subset_stats(subset)
-
-        return result
-    
-    def _count_errors(self, docs):
-        """Compute number of error annotations in the given docs. """
-
-        errors = collections.Counter()
-        for doc in docs:
-            for ann in doc.annotated.get_annotations():
-                try:
-                    errors[ann.meta["error_type"]] += 1
-                except KeyError:
-                    print(doc.doc_id)
-                    print(ann)
-                    errors["MISSING"] += 1
-                    #raise
-                    continue
-                errors["TOTAL"] += 1
-        return dict(sorted(errors.items()))
+
+def compute_partial_stats(corpus, index=None):
+    """Return (PartialStats, CountIndex) of the corpus.
+
+    If `index` is None, counts are taken from the stored index, which is
+    updated in memory but not saved.
+    """
+
+    if index is None:
+        index = CountIndex.for_corpus(corpus)
+
+    partial = PartialStats()
+    for meta in corpus._get_metadata():
+        partial.add(meta, index.get(meta))
+    return partial, index
 
 
 def main(args):
     from ua_gec import Corpus
     corpus = Corpus(args.partition, args.layer)
-    stats = CorpusStatistics(corpus)
+    stats = CorpusStatistics(corpus, workers=args.workers, save_index=args.save_index)
     stats.pretty_print()
 
 
@@ -107,5 +191,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("partition", choices=["all", "train", "test"])
     parser.add_argument("layer", choices=["gec-fluency", "gec-only"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--save-index", action="store_true",
+                        help="save the updated count index next to the data")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,259 @@
+"""Read corpus data from a directory or straight from an archive.
+
+The corpus only needs a few operations from the files it reads: joining
+paths with `/`, `read_text()`, `read_bytes()`, `open()` and `stat()`.
+`pathlib.Path` provides them for a data directory. `ArchivePath` provides
+them for members of a zip or tar archive, so the archive doesn't need to be
+extracted first.
+
+Zip archives and plain `.tar` files are indexed: members are read on
+demand. Compressed tars (`.tar.gz` etc.) can't be seeked, so they are
+fully decompressed into memory when opened, in every process that opens
+them; repack them as zip or plain tar for large data.
+
+Archives keep their file open until `close()` is called (they are also
+context managers; the archive of a path is `ArchivePath.archive`, and
+`Corpus.close()` closes the archive of a corpus).
+"""
+import io
+import os
+import pathlib
+import posixpath
+import tarfile
+import threading
+import zipfile
+
+
+def open_root(path):
+    """Return the data root (the folder with `metadata.csv`) as a path.
+
+    Args:
+        path (str or Path): a data directory, or a `.zip` or `.tar[.gz|.bz2|.xz]`
+            archive that contains one.
+
+    Returns:
+        pathlib.Path or ArchivePath
+    """
+
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return path
+    if zipfile.is_zipfile(path):
+        archive = ZipArchive(path)
+    elif tarfile.is_tarfile(path):
+        archive = TarArchive(path)
+    else:
+        raise ValueError(f"{path} is neither a directory nor a zip or tar archive")
+
+    return ArchivePath(archive, archive.find_root())
+
+
+class ArchivePath:
+    """A path to a member of an archive.
+
+    Supports a subset of the `pathlib.Path` interface.
+    """
+
+    def __init__(self, archive, name):
+        self._archive = archive
+        self._name = name.strip("/")
+
+    def __truediv__(self, other):
+        name = posixpath.normpath(posixpath.join(self._name, str(other)))
+        if name == ".":
+            name = ""
+        return ArchivePath(self._archive, name)
+
+    def __str__(self):
+        return f"{self._archive.path}/{self._name}"
+
+    def __repr__(self):
+        return "<ArchivePath({!r})>".format(str(self))
+
+    def __eq__(self, other):
+        if type(self) != type(other):
+            return False
+        return self._archive is other._archive and self._name == other._name
+
+    def __hash__(self):
+        return hash((id(self._archive), self._name))
+
+    @property
+    def archive(self):
+        return self._archive
+
+    @property
+    def name(self):
+        return posixpath.basename(self._name)
+
+    @property
+    def parent(self):
+        return ArchivePath(self._archive, posixpath.dirname(self._name))
+
+    def exists(self):
+        return self._archive.exists(self._name)
+
+    def read_bytes(self):
+        return self._archive.read(self._name)
+
+    def read_text(self, encoding=None):
+        with self.open(encoding=encoding) as f:
+            return f.read()
+
+    def open(self, mode="r", encoding=None):
+        if mode not in ("r", "rt", "rb"):
+            raise ValueError("Archives are read-only")
+        data = io.BytesIO(self.read_bytes())
+        if mode == "rb":
+            return data
+        return io.TextIOWrapper(data, encoding=encoding or "utf-8")
+
+    def stat(self):
+        return os.stat_result((0, 0, 0, 0, 0, 0, self._archive.size(self._name), 0, 0, 0))
+
+
+class ZipArchive:
+    """Random access to zip members through the central directory. """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._zip = zipfile.ZipFile(self.path)
+        self._infos = {info.filename.rstrip("/"): info for info in self._zip.infolist()}
+        self._dirs = _parent_dirs(self._infos)
+
+    def __reduce__(self):
+        # Reopen in worker processes instead of sharing the file handle
+        return type(self), (self.path,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def names(self):
+        return self._infos.keys()
+
+    def exists(self, name):
+        return name in self._infos or name in self._dirs
+
+    def read(self, name):
+        try:
+            return self._zip.read(self._infos[name])
+        except KeyError:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+
+    def size(self, name):
+        try:
+            return self._infos[name].file_size
+        except KeyError:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+
+    def find_root(self):
+        return _find_root(self.names(), self.path)
+
+
+class TarArchive:
+    """Random access to tar members.
+
+    Only uncompressed tars are indexed: members are read by offset with
+    seeks (under a lock, so threads can share the archive). Compressed tars
+    can't be seeked efficiently, so all their members are decompressed into
+    memory when the archive is opened (and again when it is unpickled in a
+    worker process).
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._offsets = {}  # name => (offset, size)
+        self._contents = {}  # name => bytes (compressed archives only)
+        try:
+            tar = tarfile.open(self.path, "r:")
+            compressed = False
+        except tarfile.ReadError:
+            tar = tarfile.open(self.path, "r:*")
+            compressed = True
+
+        with tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                name = posixpath.normpath(member.name).lstrip("/")
+                if compressed:
+                    self._contents[name] = tar.extractfile(member).read()
+                self._offsets[name] = (member.offset_data, member.size)
+        self._dirs = _parent_dirs(self._offsets)
+        self._file = None if compressed else open(self.path, "rb")
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __reduce__(self):
+        # Reopen in worker processes instead of sharing the file handle
+        return type(self), (self.path,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        self._contents = {}
+        if self._file is not None:
+            self._file.close()
+
+    def names(self):
+        return self._offsets.keys()
+
+    def exists(self, name):
+        return name in self._offsets or name in self._dirs
+
+    def read(self, name):
+        if self._closed:
+            raise ValueError(f"{self.path} is closed")
+        if name not in self._offsets:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        if self._file is None:
+            return self._contents[name]
+        offset, size = self._offsets[name]
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def size(self, name):
+        try:
+            return self._offsets[name][1]
+        except KeyError:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+
+    def find_root(self):
+        return _find_root(self.names(), self.path)
+
+
+def _parent_dirs(names):
+    """Return the set of all directories that contain any of `names`. """
+
+    dirs = set()
+    for name in names:
+        while name:
+            name = posixpath.dirname(name)
+            if name in dirs:
+                break
+            dirs.add(name)
+    return dirs
+
+
+def _find_root(names, path):
+    """Return the shortest directory in the archive that has `metadata.csv`. """
+
+    candidates = [
+        posixpath.dirname(name) for name in names
+        if posixpath.basename(name) == "metadata.csv"
+    ]
+    if not candidates:
+        raise ValueError(f"{path} doesn't contain metadata.csv")
+    return min(candidates, key=lambda name: (name.count("/"), name))
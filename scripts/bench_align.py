@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Benchmark `align_sentences()` of postprocess_dataset.py on long documents.
+
+Source and target texts of `--concat` consecutive documents are joined into
+one long document and split into sentences with a simple regex (a stand-in
+for Stanza, so that no models are needed). Each document is aligned with the
+current implementation and with the previous one, which computed the full
+edit distance of all candidates, and the results are checked to be equal.
+"""
+import argparse
+import re
+import time
+
+from pyxdameraulevenshtein import damerau_levenshtein_distance
+
+import ua_gec
+from postprocess_dataset import align_sentences
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--partition", default="test")
+    parser.add_argument("--layer", default="gec-fluency")
+    parser.add_argument("--concat", type=int, default=10,
+                        help="number of corpus documents joined into one")
+    parser.add_argument("--limit", type=int, default=20,
+                        help="number of long documents to align")
+    args = parser.parse_args()
+
+    docs = ua_gec.Corpus(args.partition, args.layer).get_documents()
+    pairs = []
+    for i in range(0, len(docs), args.concat):
+        group = docs[i:i + args.concat]
+        pairs.append((split("\n".join(doc.source for doc in group)),
+                      split("\n".join(doc.target for doc in group))))
+    pairs = pairs[:args.limit]
+
+    num_sentences = sum(len(src) for src, _ in pairs)
+    print(f"{len(pairs)} documents, {num_sentences / len(pairs):.0f} source sentences on average")
+    print(f"{'implementation':<16} {'total, s':>10} {'per doc, ms':>12}")
+    reference, reference_time = _timeit(lambda: [align_reference(*pair) for pair in pairs])
+    current, current_time = _timeit(lambda: [align_sentences(*pair) for pair in pairs])
+    for name, elapsed in [("full distance", reference_time), ("bounded", current_time)]:
+        print(f"{name:<16} {elapsed:>10.2f} {elapsed / len(pairs) * 1000:>12.1f}")
+    print(f"speedup: {reference_time / current_time:.1f}x")
+    assert current == reference, "alignments differ"
+
+
+def split(text):
+    return [s for s in SENTENCE_END.split(text) if s.strip()]
+
+
+def align_reference(src_sentences, tgt_sentences):
+    """The previous implementation: full distance of every candidate. """
+
+    combinations = [(1, 1), (1, 2), (1, 3), (2, 1), (3, 1), (2, 2)]
+    result_src = []
+    result_tgt = []
+    pos_src = 0
+    pos_tgt = 0
+    while pos_src < len(src_sentences):
+        min_dist = 10e9
+        for take_src, take_tgt in combinations:
+            if pos_src + take_src >= len(src_sentences):
+                take_tgt = len(tgt_sentences) - pos_tgt
+            src = " ".join(src_sentences[pos_src : pos_src + take_src])
+            tgt = " ".join(tgt_sentences[pos_tgt : pos_tgt + take_tgt])
+            dist = damerau_levenshtein_distance(src, tgt)
+            if dist < min_dist:
+                min_dist = dist
+                best = (take_src, take_tgt, src, tgt)
+        pos_src += best[0]
+        pos_tgt += best[1]
+        result_src.append(best[2])
+        result_tgt.append(best[3])
+    return result_src, result_tgt
+
+
+def _timeit(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Benchmark CorpusStatistics on the whole corpus for both layers.
+
+Reports the time to build the per-document count index from scratch, the
+time to validate an up-to-date index, and the time to aggregate counts into
+breakdowns. Aggregation is compared against the previous implementation,
+which filtered the document list once per metadata value.
+"""
+import collections
+import time
+
+from ua_gec import Corpus, AnnotationLayer
+from ua_gec.count_index import CountIndex
+from ua_gec.stats import BREAKDOWNS, compute_partial_stats
+
+
+def main():
+    print(f"{'layer':<12} {'index build, s':>15} {'index check, ms':>16} "
+          f"{'single pass, ms':>16} {'per-value, ms':>14}")
+    for layer in AnnotationLayer:
+        corpus = Corpus("all", layer)
+
+        start = time.perf_counter()
+        index = CountIndex.build(corpus)
+        build_time = time.perf_counter() - start
+        check_time = min(_timeit(lambda: CountIndex.build(corpus, index)) for _ in range(3))
+
+        all_docs = [(meta, index.get(meta)) for meta in corpus._get_metadata()]
+        single_pass = min(_timeit(lambda: compute_partial_stats(corpus, index)[0].to_stats())
+                          for _ in range(5))
+        per_value = min(_timeit(lambda: per_value_stats(all_docs)) for _ in range(5))
+        print(f"{layer.value:<12} {build_time:>15.2f} {check_time * 1000:>16.1f} "
+              f"{single_pass * 1000:>16.1f} {per_value * 1000:>14.1f}")
+
+
+def per_value_stats(all_docs):
+    """The previous implementation: one list filter per metadata value. """
+
+    docs = [(meta, counts) for meta, counts in all_docs if meta.annotator_id == 1]
+    result = {}
+    for title, field in BREAKDOWNS:
+        result[title] = {}
+        for value in sorted({getattr(meta, field) for meta, _ in docs}):
+            subset = [(m, c) for m, c in docs if getattr(m, field) == value]
+            result[title][value] = {
+                "Documents": len(subset),
+                "Sentences": sum(c.sentences for _, c in subset),
+                "Tokens": sum(c.tokens for _, c in subset),
+                "Unique users": len({m.author_id for m, _ in subset}),
+            }
+
+    errors = collections.Counter()
+    for _, counts in all_docs:
+        for error_type, n in counts.errors.items():
+            errors[error_type] += n
+            if error_type != "MISSING":
+                errors["TOTAL"] += n
+    result["Number of errors (by 2 annotators)"] = dict(sorted(errors.items()))
+    return result
+
+
+def _timeit(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Compare reading the corpus from a directory vs. from zip and tar archives.
+
+Plain tars are indexed and read with seeks; compressed tars are
+decompressed into memory on open. Archives of `--data` are created in a
+temporary directory unless given explicitly. For each storage, reports the startup time (open + metadata)
+and the throughput of reading annotated and tokenized sentence views.
+"""
+import argparse
+import pathlib
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import ua_gec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default="./data")
+    parser.add_argument("--zip", help="existing zip archive of --data")
+    parser.add_argument("--tar", help="existing uncompressed tar archive of --data")
+    parser.add_argument("--tar-gz", help="existing gzipped tar archive of --data")
+    parser.add_argument("--layer", default="gec-fluency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = args.zip or make_zip(args.data, pathlib.Path(tmp_dir) / "data.zip")
+        tar_path = args.tar or make_tar(args.data, pathlib.Path(tmp_dir) / "data.tar")
+        tar_gz_path = args.tar_gz or make_tar(args.data, pathlib.Path(tmp_dir) / "data.tar.gz")
+
+        storages = [("directory", args.data), ("zip", zip_path),
+                    ("tar", tar_path), ("tar.gz", tar_gz_path)]
+        print(f"{'storage':<12} {'startup, s':>12} {'read, s':>10} {'docs/s':>10} {'MB/s':>8}")
+        for name, root in storages:
+            startup, elapsed, num_docs, num_bytes = bench(root, args.layer)
+            print(f"{name:<12} {startup:>12.3f} {elapsed:>10.2f} "
+                  f"{num_docs / elapsed:>10.0f} {num_bytes / elapsed / 1e6:>8.1f}")
+
+
+def bench(root, layer):
+    start = time.perf_counter()
+    with ua_gec.Corpus("all", layer, root=root) as corpus:
+        len(corpus)
+        startup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        num_docs = num_bytes = 0
+        for doc in corpus:
+            num_docs += 1
+            num_bytes += len(str(doc.annotated).encode("utf-8"))
+            num_bytes += sum(len(s.encode("utf-8")) + 1 for s in doc.source_sentences_tokenized)
+            num_bytes += sum(len(s.encode("utf-8")) + 1 for s in doc.target_sentences_tokenized)
+        elapsed = time.perf_counter() - start
+
+    return startup, elapsed, num_docs, num_bytes
+
+
+def make_zip(data_dir, path):
+    data_dir = pathlib.Path(data_dir)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for file in sorted(data_dir.rglob("*")):
+            if file.is_file():
+                zf.write(file, "data/" + file.relative_to(data_dir).as_posix())
+    return path
+
+
+def make_tar(data_dir, path):
+    mode = "w:gz" if str(path).endswith(".gz") else "w"
+    with tarfile.open(path, mode) as tar:
+        tar.add(data_dir, "data")
+    return path
+
+
+if __name__ == "__main__":
+    main()
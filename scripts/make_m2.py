@@ -4,55 +4,320 @@
 M2 specifics:
 - Annotations are done on a sentence level.
 - Texts are tokenized with Stanza.
-- The error types are copied from UA-GEC.
+- The error types are copied from UA-GEC. A native edit that covers
+  annotations of different types has all of them, joined with "+"
+  (e.g., `Spelling+Punctuation`).
+- Edits are either derived by ERRANT from source and target sentences
+  (`--engine errant`, the default), or projected from UA-GEC annotations
+  onto source tokens (`--engine native`, doesn't need ERRANT).
 - There's a special document heading sentence added to the beginning of each
   document. It looks like this: `# 0123` (where `0123` is the document ID).
   This adds opportunity to utilize document-level context.
 """
 import argparse
-import re
+import bisect
+import collections
+import multiprocessing
+import os
 import sys
-from io import StringIO
 
-import errant
 import ua_gec
 from tqdm import tqdm
+from ua_gec.cache import SentenceCache
+from ua_gec.corpus import parse_shard
+from ua_gec.m2 import M2Reader, M2Writer, doc_heading, noop_edit
+from ua_gec.manifest import Manifest, parse_key
+
+try:
+    import errant
+    import spacy
+    from spacy.tokens import Doc, DocBin
+except ImportError:
+    errant = None
+
+M2_VERSION = "make_m2/1"
+# Derived views read by both engines; their hashes are in the manifest
+M2_VIEWS = ("source-sentences-tokenized", "target-sentences-tokenized")
+DEFAULT_BATCH_SIZE = 256
+# Pipeline components whose annotations ERRANT reads (POS tags, lemmas,
+# dependencies), plus those they depend on in spaCy 3 pipelines
+ERRANT_COMPONENTS = ("tok2vec", "tagger", "attribute_ruler", "lemmatizer", "parser")
+DEFAULT_PARSE_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "ua_gec", "errant_parses.sqlite")
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--partition", choices=["test", "train", "all"], required=True)
-    parser.add_argument("--layer", type=ua_gec.AnnotationLayer, required=True)
+    parser.add_argument("--partition", choices=["test", "train", "all"])
+    parser.add_argument("--layer", type=ua_gec.AnnotationLayer)
     parser.add_argument("--output", required=True)
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="process only shard I of N (0-based), e.g. 0/4")
+    parser.add_argument("--merge", nargs="+", metavar="SHARD_M2",
+                        help="merge per-shard M2 files into --output")
+    parser.add_argument("--full", action="store_true",
+                        help="regenerate all documents, not only the changed ones")
+    parser.add_argument("--engine", choices=["errant", "native"], default="errant",
+                        help="derive edits with ERRANT or project them from the annotations")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes, each with its own ERRANT")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of sentences parsed by spaCy at once")
+    parser.add_argument("--parse-cache", default=DEFAULT_PARSE_CACHE,
+                        help="sqlite file with cached spaCy parses, shared by all runs "
+                             "(default: %(default)s)")
+    parser.add_argument("--no-parse-cache", action="store_true",
+                        help="parse all sentences, don't read or write the parse cache")
     args = parser.parse_args()
 
+    if args.merge:
+        merge_m2(args.merge, args.output)
+        return
+
+    if args.partition is None or args.layer is None:
+        parser.error("--partition and --layer are required unless --merge is given")
+    if args.engine == "errant" and errant is None:
+        parser.error("ERRANT is not installed; install it or use --engine native")
+
     corpus = ua_gec.Corpus(args.partition, args.layer)
-    make_m2(corpus, args.output)
+    if args.shard:
+        index, num_shards = args.shard
+        corpus = corpus.shard(num_shards, index)
+    parse_cache = None if args.no_parse_cache else args.parse_cache
+    make_m2(corpus, args.output, full=args.full, engine=args.engine, workers=args.workers,
+            batch_size=args.batch_size, parse_cache=parse_cache)
+
+
+def merge_m2(shard_paths, output_path):
+    """Merge per-shard M2 files into the M2 file of a single-node run.
+
+    Document headings are told apart from `# ...` sentences by the doc_ids
+    in the manifest of each shard, if it exists.
+    """
+
+    readers = []
+    for path in shard_paths:
+        manifest = Manifest.load(f"{path}.manifest.json")
+        expected = None if manifest is None else {parse_key(key)[1] for key in manifest.hashes}
+        readers.append(M2Reader(path, expected))
+    doc_ids = {doc_id: reader for reader in readers for doc_id in reader.doc_ids()}
+    with M2Writer(output_path) as writer:
+        for doc_id in sorted(doc_ids):
+            writer.write(doc_ids[doc_id].document_text(doc_id))
+    for reader in readers:
+        reader.close()
+
+
+def make_m2(corpus, output_path, full=False, engine="errant", workers=1,
+            batch_size=DEFAULT_BATCH_SIZE, parse_cache=None):
+    """Write M2 file for the corpus.
+
+    Unless `full` is set, documents whose annotated files and tokenized
+    sentences didn't change since the previous run (as recorded in the
+    manifest next to `output_path`) are copied from the existing output
+    instead of being regenerated.
+
+    `engine` is "errant" to derive edits with ERRANT, or "native" to
+    project them from the annotations (see `get_native_edits()`).
+
+    With `workers` > 1, documents are processed in chunks by a pool of
+    processes. The output is the same as with a single worker.
+
+    With ERRANT, sentences are parsed by spaCy in batches of `batch_size`.
+    If `parse_cache` (path to a sqlite file) is given, parses are read from
+    and saved to it.
+    """
+
+    manifest_path = f"{output_path}.manifest.json"
+    if engine == "errant":
+        tool_version = f"{M2_VERSION} errant/{errant.__version__}"
+    else:
+        tool_version = f"{M2_VERSION} native/3"
+    manifest = Manifest.build(corpus, tool_version, views=M2_VIEWS)
+    doc_ids = sorted({parse_key(key)[1] for key in manifest.hashes})
+
+    old = None
+    reused = set()
+    if not full and os.path.exists(output_path):
+        old_manifest = Manifest.load(manifest_path)
+        changed = manifest.changed_doc_ids(old_manifest)
+        expected = set(doc_ids)
+        if old_manifest is not None:
+            expected |= {parse_key(key)[1] for key in old_manifest.hashes}
+        old = M2Reader(output_path, expected)
+        reused = set(old.doc_ids()) & set(doc_ids) - changed
+
+    todo = sorted(set(doc_ids) - reused)
+    corpus = corpus.select(todo)
+    chunks = [todo[i:i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+
+    # Documents are written in doc_id order as soon as they are ready
+    blocks = {}
+    written = 0
+    with M2Writer(output_path) as writer, tqdm(total=len(todo)) as progress:
+        for chunk_blocks in _iter_chunk_blocks(corpus, chunks, engine, workers,
+                                               batch_size, parse_cache):
+            blocks.update(chunk_blocks)
+            progress.update(len(chunk_blocks))
+            while written < len(doc_ids):
+                doc_id = doc_ids[written]
+                if doc_id in reused:
+                    writer.write(old.document_text(doc_id))
+                elif doc_id in blocks:
+                    writer.write(blocks.pop(doc_id))
+                else:
+                    break
+                written += 1
+        for doc_id in doc_ids[written:]:
+            writer.write(old.document_text(doc_id))
+
+    if old is not None:
+        old.close()
+    manifest.save(manifest_path)
+
+
+def _iter_chunk_blocks(corpus, chunks, engine, workers, batch_size, parse_cache):
+    """Yield {doc_id: M2 block} of each chunk of doc_ids, in any order. """
+
+    if workers > 1:
+        initargs = (corpus, engine, batch_size, parse_cache)
+        with multiprocessing.Pool(workers, _init_worker, initargs) as pool:
+            yield from pool.imap_unordered(_make_chunk_blocks, chunks)
+    else:
+        errant_, cache = load_engine(engine, parse_cache)
+        for chunk in chunks:
+            yield make_doc_blocks(errant_, corpus.select(chunk), batch_size, cache)
+
 
+# Number of documents processed (and parsed in bulk) at once. Sentences are
+# only batched within a chunk, so a chunk should have several `batch_size`
+# batches worth of sentences (a document has ~50 unique source and target
+# sentences); a larger one delays the in-order output and balances worker
+# load worse.
+CHUNK_SIZE = 64
 
-def make_m2(corpus, output_path):
+# Per-process state of pool workers
+_worker_errant = None
+_worker_corpus = None
+_worker_batch_size = None
+_worker_cache = None
+
+
+def _init_worker(corpus, engine, batch_size, parse_cache):
+    global _worker_errant, _worker_corpus, _worker_batch_size, _worker_cache
+    _worker_errant, _worker_cache = load_engine(engine, parse_cache)
+    _worker_corpus = corpus
+    _worker_batch_size = batch_size
+
+
+def _make_chunk_blocks(doc_ids):
+    corpus = _worker_corpus.select(doc_ids)
+    return make_doc_blocks(_worker_errant, corpus, _worker_batch_size, _worker_cache)
+
+
+def load_engine(engine, parse_cache):
+    """Return (ERRANT annotator, parse cache), or (None, None) for the native engine. """
+
+    if engine == "native":
+        return None, None
     errant_ = errant.load("en")
-    doc_ids = sorted({doc.doc_id for doc in corpus})
-    result = []
-    for doc_id in tqdm(doc_ids):
-        doc = corpus.get_doc(doc_id, annotator_id=1)
-        edits_1 = get_sentence_edits(errant_, doc)
-        try:
-            doc = corpus.get_doc(doc_id, annotator_id=2)
-            edits_2 = get_sentence_edits(errant_, doc)
-        except LookupError:
+    return errant_, open_parse_cache(errant_, parse_cache)
+
+
+def open_parse_cache(errant_, path):
+    """Return SentenceCache of parses by the ERRANT pipeline, or None if `path` is None. """
+
+    if path is None:
+        return None
+    meta = errant_.nlp.meta
+    version = (f"errant/{errant.__version__} spacy/{spacy.__version__} "
+               f"{meta['lang']}_{meta['name']}/{meta['version']}")
+    return SentenceCache(path, version)
+
+
+def make_doc_blocks(errant_, corpus, batch_size=DEFAULT_BATCH_SIZE, cache=None):
+    """Return {doc_id: M2 block} for every document in the corpus.
+
+    Sentences of all documents are parsed together, in batches of
+    `batch_size`. If `errant_` is None, edits are projected from the
+    annotations instead (see `get_native_edits_or_fallback()`).
+    """
+
+    docs = collections.defaultdict(dict)
+    for doc in corpus:
+        docs[doc.doc_id][doc.meta.annotator_id] = doc
+
+    if errant_ is None:
+        get_edits = get_native_edits_or_fallback
+    else:
+        sentences = []
+        for annotators in docs.values():
+            for doc in annotators.values():
+                sentences += doc.source_sentences_tokenized
+                sentences += doc.target_sentences_tokenized
+        parsed = parse_sentences(errant_, sentences, batch_size, cache)
+        get_edits = lambda doc: get_sentence_edits(errant_, doc, parsed)
+
+    blocks = {}
+    for doc_id in sorted(docs):
+        annotators = docs[doc_id]
+        doc = annotators[1]
+        edits_1 = get_edits(doc)
+        if 2 in annotators:
+            doc = annotators[2]
+            edits_2 = get_edits(doc)
+        else:
             edits_2 = None
 
-        m2 = doc_edits_to_m2(doc, edits_1, edits_2)
-        result.append(m2)
+        blocks[doc_id] = doc_edits_to_m2(doc, edits_1, edits_2)
+    return blocks
 
-    m2 = "".join(result)
 
-    with open(output_path, "wt") as f:
-        f.write(m2)
+def parse_sentences(errant_, sentences, batch_size=DEFAULT_BATCH_SIZE, cache=None):
+    """Parse tokenized sentences the same way as `errant_.parse()` does.
 
+    Instead of running the spaCy pipeline once per sentence, each of
+    `ERRANT_COMPONENTS` in the pipeline processes unique sentences in
+    batches via `pipe()`; other components (e.g. `ner`) are skipped. Parses
+    found in `cache` (SentenceCache) are deserialized instead, and new
+    parses are added to it.
 
-def get_sentence_edits(errant_, doc):
+    Returns:
+        dict: sentence => spaCy Doc.
+    """
+
+    nlp = errant_.nlp
+    unique = list(dict.fromkeys(sentences))
+    parsed = {}
+    if cache is not None:
+        for sentence, data in cache.get_many(unique).items():
+            parsed[sentence] = next(DocBin().from_bytes(data).get_docs(nlp.vocab))
+
+    todo = [sentence for sentence in unique if sentence not in parsed]
+    docs = (Doc(nlp.vocab, sentence.split()) for sentence in todo)
+    for name, component in nlp.pipeline:
+        if name not in ERRANT_COMPONENTS:
+            continue
+        if hasattr(component, "pipe"):
+            docs = component.pipe(docs, batch_size=batch_size)
+        else:
+            docs = map(component, docs)
+    new = dict(zip(todo, docs))
+
+    if cache is not None and new:
+        cache.put_many({s: DocBin(docs=[doc]).to_bytes() for s, doc in new.items()})
+    parsed.update(new)
+    return parsed
+
+
+def get_sentence_edits(errant_, doc, parsed):
+    """Return ERRANT edits of every sentence of the document.
+
+    Args:
+        errant_: ERRANT annotator.
+        doc: Document.
+        parsed: dict of sentence => spaCy Doc (see `parse_sentences()`)
+            that has all source and target sentences of the document.
+    """
 
     edits_by_sentence = []
 
@@ -61,8 +326,8 @@ def get_sentence_edits(errant_, doc):
     doc_index = 0  # character index in the document (source)
     src_text = doc.source
     for src_sent, tgt_sent in zip(doc.source_sentences_tokenized, doc.target_sentences_tokenized):
-        src = errant_.parse(src_sent)
-        tgt = errant_.parse(tgt_sent)
+        src = parsed[src_sent]
+        tgt = parsed[tgt_sent]
         edits = errant_.annotate(src, tgt)
         edits_by_token = {}
         insertions_by_token = {}
@@ -120,6 +385,215 @@ def get_sentence_edits(errant_, doc):
 
 
 
+def get_native_edits_or_fallback(doc):
+    """Return `get_native_edits()` of the document, or ERRANT edits if the
+    projection fails.
+
+    Without ERRANT, a document that can't be projected is written without
+    edits. Either way, a warning is printed.
+    """
+
+    try:
+        return get_native_edits(doc)
+    except ValueError as e:
+        if errant is None:
+            print(f"WARNING: {e}; writing doc_id={doc.doc_id} without edits "
+                  f"(install ERRANT to fall back to it)", file=sys.stderr)
+            return [[] for _ in doc.source_sentences_tokenized]
+        print(f"WARNING: {e}; using ERRANT for doc_id={doc.doc_id}", file=sys.stderr)
+
+    if not hasattr(get_native_edits_or_fallback, "errant"):
+        get_native_edits_or_fallback.errant = errant.load("en")
+    errant_ = get_native_edits_or_fallback.errant
+    sentences = doc.source_sentences_tokenized + doc.target_sentences_tokenized
+    return get_sentence_edits(errant_, doc, parse_sentences(errant_, sentences))
+
+
+class NativeEdit(collections.namedtuple("NativeEdit", "o_start o_end type c_str")):
+    """Edit projected from an annotation. Formatted like ERRANT's `Edit`. """
+
+    def to_m2(self, annotator_id=0):
+        return (f"A {self.o_start} {self.o_end}|||{self.type}|||{self.c_str}"
+                f"|||REQUIRED|||-NONE-|||{annotator_id}")
+
+
+def get_native_edits(doc):
+    """Project annotations of the document onto its tokenized sentences.
+
+    Source and target tokens are mapped to char offsets of the source and
+    corrected texts. A boundary between source tokens is paired with the
+    boundaries between target tokens at the same place of the corrected
+    text, unless it's inside an annotation. Tokens between two consecutive
+    pairs of boundaries form an edit if they differ, so applying the edits
+    reproduces the target tokens exactly, even where the target was
+    tokenized differently or an annotation crosses sentences.
+
+    An edit has the error types of all annotations it overlaps, joined
+    with "+" if they differ, or "Other" if it only fixes tokenization.
+    Source sentence i is corrected into target sentence i, so applying
+    each sentence's edits reproduces its tokenized target. An edit that
+    crosses sentences, or moves a token to another sentence, becomes
+    a deletion in one sentence and an insertion in the other.
+
+    Raises:
+        ValueError: if a token isn't found in the text of the document, or
+            the numbers of source and target sentences differ.
+
+    Returns:
+        List of lists of `NativeEdit` for each source sentence.
+    """
+
+    src = _TokenSpans(doc.source, doc.source_sentences_tokenized, doc)
+    tgt = _TokenSpans(doc.target, doc.target_sentences_tokenized, doc)
+    if len(src.sentences) != len(tgt.sentences):
+        raise ValueError(f"{len(src.sentences)} source and {len(tgt.sentences)} "
+                         f"target sentences in doc_id={doc.doc_id}")
+    annotations = sorted(
+        (ann for ann in doc.annotated.get_annotations() if ann.suggestions),
+        key=lambda ann: ann.start)
+
+    # Unchanged segments of the source: [start, end] => shift in the target
+    starts, ends, shifts = [], [], []
+    pos = shift = 0
+    for ann in annotations:
+        starts.append(pos)
+        ends.append(ann.start)
+        shifts.append(shift)
+        pos = ann.end
+        shift += len(ann.top_suggestion) - len(ann.source_text)
+    starts.append(pos)
+    ends.append(len(doc.source))
+    shifts.append(shift)
+
+    # Boundary b is the whitespace between tokens b - 1 and b
+    tgt_lo, tgt_hi = tgt.boundaries(len(doc.target))
+    pairs = [(0, 0)]
+    for b, (lo, hi) in enumerate(zip(*src.boundaries(len(doc.source)))):
+        k = max(bisect.bisect_right(starts, lo) - 1, 0)
+        while k < len(starts) and starts[k] <= hi:
+            image_lo = max(lo, starts[k]) + shifts[k]
+            image_hi = min(hi, ends[k]) + shifts[k]
+            c = bisect.bisect_left(tgt_hi, image_lo)
+            while image_lo <= image_hi and c < len(tgt_lo) and tgt_lo[c] <= image_hi:
+                if b >= pairs[-1][0] and c >= pairs[-1][1] and (b, c) != pairs[-1]:
+                    pairs.append((b, c))
+                c += 1
+            k += 1
+    if pairs[-1] != (len(src.tokens), len(tgt.tokens)):
+        pairs.append((len(src.tokens), len(tgt.tokens)))
+
+    # Each source sentence gets the target tokens of the target sentence
+    # with the same index. Tokens between consecutive pairs form an edit
+    # in every sentence where they differ
+    edits = [[] for _ in src.sentences]
+    for (b1, c1), (b2, c2) in zip(pairs, pairs[1:]):
+        parts = [part for part in _split_span(src, tgt, b1, c1, b2, c2)
+                 if src.sentences[part[0]][part[1]:part[2]] != part[3]]
+        if not parts:
+            continue
+        if b1 < b2:
+            span_start, span_end = src.starts[b1], src.ends[b2 - 1]
+        else:
+            span_start, span_end = src.boundary(b1, len(doc.source))
+        error_type = _error_type(annotations, span_start, span_end)
+        for sentence, o_start, o_end, correction in parts:
+            edit = NativeEdit(o_start, o_end, error_type, " ".join(correction))
+            sentence_edits = edits[sentence]
+            # An insertion is merged with the next edit at the same token,
+            # since the order of both would be ambiguous
+            if sentence_edits and sentence_edits[-1].o_start == sentence_edits[-1].o_end == o_start:
+                edit = _merge_edits(sentence_edits.pop(), edit)
+            sentence_edits.append(edit)
+
+    return edits
+
+
+def _error_type(annotations, start, end):
+    """Return the error types of annotations that overlap [start, end). """
+
+    types = []
+    for ann in annotations:
+        if ann.start > end:
+            break
+        overlaps = ann.start < end and ann.end > start
+        inserted = ann.start == ann.end and start <= ann.start <= end
+        if overlaps or inserted:
+            error_type = ann.meta.get("error_type")
+            if error_type and error_type not in types:
+                types.append(error_type)
+    return "+".join(types) or "Other"
+
+
+def _split_span(src, tgt, b1, c1, b2, c2):
+    """Split source tokens [b1, b2) and target tokens [c1, c2) by sentence.
+
+    Yields:
+        (sentence, o_start, o_end, correction tokens) for every sentence
+        that has any of the tokens. `o_start` and `o_end` are token indexes
+        in the source sentence; they are equal if it has none of them.
+    """
+
+    corrections = collections.defaultdict(list)
+    for j in range(c1, c2):
+        corrections[tgt.positions[j][0]].append(tgt.tokens[j])
+    sentences = {src.positions[i][0] for i in range(b1, b2)} | set(corrections)
+
+    for sentence in sorted(sentences):
+        first = src.firsts[sentence]
+        length = len(src.sentences[sentence])
+        o_start = min(max(b1 - first, 0), length)
+        o_end = min(max(b2 - first, 0), length)
+        yield sentence, o_start, o_end, corrections[sentence]
+
+
+def _merge_edits(edit_1, edit_2):
+    """Return an edit that applies two adjacent edits at once. """
+
+    types = edit_1.type.split("+")
+    types += [t for t in edit_2.type.split("+") if t not in types]
+    if len(types) > 1 and "Other" in types:
+        types.remove("Other")
+    c_str = " ".join(c for c in (edit_1.c_str, edit_2.c_str) if c)
+    return NativeEdit(edit_1.o_start, edit_2.o_end, "+".join(types), c_str)
+
+
+class _TokenSpans:
+    """Char offsets in `text` of the tokens of tokenized sentences. """
+
+    def __init__(self, text, sentences, doc):
+        self.sentences = [sentence.split() for sentence in sentences]
+        self.tokens = []
+        self.positions = []  # (sentence index, token index in the sentence)
+        self.firsts = []  # index of the first token of every sentence
+        self.starts = []
+        self.ends = []
+        pos = 0
+        for i, tokens in enumerate(self.sentences):
+            self.firsts.append(len(self.tokens))
+            for j, token in enumerate(tokens):
+                start = text.find(token, pos)
+                if start == -1:
+                    raise ValueError(f"Token {token!r} not found in doc_id={doc.doc_id}")
+                pos = start + len(token)
+                self.tokens.append(token)
+                self.positions.append((i, j))
+                self.starts.append(start)
+                self.ends.append(pos)
+
+    def boundary(self, b, length):
+        """Return [start, end] of the text between tokens b - 1 and b. """
+
+        start = self.ends[b - 1] if b > 0 else 0
+        end = self.starts[b] if b < len(self.tokens) else length
+        return start, end
+
+    def boundaries(self, length):
+        """Return lists of starts and ends of all boundaries. """
+
+        spans = [self.boundary(b, length) for b in range(len(self.tokens) + 1)]
+        return [start for start, _ in spans], [end for _, end in spans]
+
+
 def doc_edits_to_m2(doc, edits_1, edits_2):
     """Convert Errant edits to M2 format.
 
@@ -133,7 +607,7 @@ def doc_edits_to_m2(doc, edits_1, edits_2):
     Returns:
         M2 string.
     """
-    result = [m2_doc_heading(doc.doc_id)]
+    result = [doc_heading(doc.doc_id)]
     if edits_2 is None:
         edits_2 = ["missing"] * len(edits_1)
      
@@ -158,18 +632,5 @@ def _edits_to_m2(edits, annotator_id):
     return result
 
 
-def noop_edit(annotator_id=0):
-    return f"A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||{annotator_id}"
-
-
-def m2_doc_heading(doc_id):
-    return f"""\
-S # {doc_id}
-A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0
-A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||1
-
-"""
-
-
 if __name__ == "__main__":
     main()
@@ -1,28 +1,72 @@
 #!/usr/bin/env python3
-"""Modify files in-place to ensure that there is no trailing newlines."""
+r"""Ensure that files end with exactly one newline.
+
+Only the last two bytes of each file are read. Files that already end with
+a single `\n` are left untouched (their mtime is kept); other files,
+including ones that end with `\r\n`, are rewritten atomically with `\r\n`
+and `\r` line endings converted to `\n` (as the text mode rewrite used to
+do). With `--check`, nothing is written and the exit status is 1 if any
+file needs to be normalized.
+"""
 import os
 import sys
-import glob
+import shutil
 import argparse
+import concurrent.futures
+
+
+def needs_normalization(path):
+    r"""Return True if the file doesn't end with exactly one `\n`."""
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return True
+        f.seek(max(size - 2, 0))
+        tail = f.read()
+    return not tail.endswith(b'\n') or tail in (b'\n\n', b'\r\n')
 
 
-def normalize_trailing_newslines(path):
-    """Normalize trailing newlines in a file."""
-    with open(path, 'r+') as f:
-        content = f.read()
-        f.seek(0)
-        f.truncate()
-        f.write(content.rstrip('\n') + '\n')
+def normalize_trailing_newslines(path, check=False):
+    """Normalize trailing newlines in a file.
+
+    Returns True if the file needed normalization. The file is only
+    rewritten if it did and `check` is False.
+    """
+    if not needs_normalization(path):
+        return False
+    if not check:
+        with open(path, 'rb') as f:
+            content = f.read()
+        content = content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content.rstrip(b'\n') + b'\n')
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    return True
 
 
 def main():
     """Main function."""
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument('path', help='path to file or directory', nargs='+')
+    parser.add_argument('path', help='path to file', nargs='+')
+    parser.add_argument('--check', action='store_true',
+                        help="don't modify files, exit with status 1 if any needs normalization")
+    parser.add_argument('--workers', type=int, default=16,
+                        help='number of threads checking files (default: %(default)s)')
     args = parser.parse_args()
-    for path in args.path:
+
+    with concurrent.futures.ThreadPoolExecutor(args.workers) as executor:
+        results = executor.map(
+            lambda path: normalize_trailing_newslines(path, args.check), args.path)
+        changed = [path for path, result in zip(args.path, results) if result]
+
+    for path in changed:
         print(path)
-        normalize_trailing_newslines(path)
+    if args.check:
+        print(f'{len(changed)} of {len(args.path)} files need normalization')
+        sys.exit(1 if changed else 0)
+    print(f'{len(changed)} of {len(args.path)} files normalized')
 
 
 if __name__ == '__main__':
@@ -14,65 +14,348 @@ source of truth.
 """
 
 import argparse
+import bisect
+import collections
+import hashlib
+import json
+import locale
+import multiprocessing
+import os
+import shutil
 from pathlib import Path
 
-import stanza
 import tqdm
 import ua_gec
 from pyxdameraulevenshtein import damerau_levenshtein_distance
+from ua_gec.cache import SentenceCache
+from ua_gec.corpus import parse_shard, shard_doc_ids
+from ua_gec.manifest import Manifest, parse_key
 
+try:
+    import stanza
+    from stanza.resources.common import DEFAULT_MODEL_DIR
+except ImportError:
+    # `align_sentences()` (e.g., in scripts/bench_align.py) works without it
+    stanza = None
+
+POSTPROCESS_VERSION = "postprocess/1"
+MANIFEST_NAME = "manifest.postprocess.json"
+
+# Number of paragraphs or sentences passed to Stanza at once
+DEFAULT_BATCH_SIZE = 256
+
+# Number of documents processed by a pool worker at once
+CHUNK_SIZE = 32
+
+DEFAULT_TOKENIZE_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "ua_gec", "stanza_tokens.sqlite")
+
+
+DERIVED_VIEWS = (
+    "source",
+    "target",
+    "source-sentences",
+    "target-sentences",
+    "source-sentences-tokenized",
+    "target-sentences-tokenized",
+)
+
+
+def main(data_dir="./data", annotation_layers=("gec-only",), shard=None, full=False,
+         batch_size=DEFAULT_BATCH_SIZE, workers=1, tokenize_cache=DEFAULT_TOKENIZE_CACHE):
+    if isinstance(annotation_layers, str):
+        annotation_layers = [annotation_layers]
+    layers = [ua_gec.AnnotationLayer(layer) for layer in annotation_layers]
+    cache = open_tokenize_cache(tokenize_cache)
+    for partition in ("train", "test"):
+        corpora = [ua_gec.Corpus(partition, annotation_layer=layer) for layer in layers]
+        if shard:
+            # All layers of a document go to the same shard, so that its
+            # sources are checked and split together
+            index, num_shards = shard
+            shard_ids = shard_doc_ids(corpora, num_shards, index)
+            corpora = [corpus.select(shard_ids) for corpus in corpora]
+
+        jobs = []
+        manifests = []
+        for layer, corpus in zip(layers, corpora):
+            out_dir = Path(data_dir) / layer.value / partition
+            print(f"~~~ Preprocess {partition} partition to {out_dir}")
+
+            # Only reprocess documents that changed since the last run
+            manifest = Manifest.build(corpus, tool_version())
+            doc_ids = {parse_key(key)[1] for key in manifest.hashes}
+            if not full:
+                changed = manifest.changed_doc_ids(Manifest.load(out_dir / MANIFEST_NAME))
+                if shard is None:
+                    remove_views(out_dir, changed - doc_ids)
+                doc_ids &= changed
+                print(f"{len(doc_ids)} changed docs")
+
+            jobs.append((out_dir, corpus.select(doc_ids)))
+            manifests.append((out_dir, manifest))
+
+        do_partition_layers(jobs, batch_size, workers, cache)
+        if shard is None:
+            for out_dir, manifest in manifests:
+                manifest.save(out_dir / MANIFEST_NAME)
+        if cache is not None:
+            print(f"Tokenization cache: {cache.hits} hits, {cache.misses} misses "
+                  f"(hit rate {cache.hit_rate:.1%})")
+            cache.hits = cache.misses = 0
+
+    if cache is not None:
+        cache.close()
+
+
+def tool_version():
+    """Return the version recorded in manifests.
+
+    It covers the code of this script, so that any change of splitting or
+    realignment regenerates all views, as does a new Stanza or model.
+    """
+
+    code = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]
+    return f"{POSTPROCESS_VERSION} code/{code} stanza/{stanza.__version__} uk/{model_version()}"
+
+
+def model_version():
+    """Return package and MD5 of the Stanza `uk` tokenizer model.
+
+    They are read from the Stanza resources index, which is downloaded
+    first if needed. The pipeline downloads the model listed there.
+    """
+
+    path = os.path.join(DEFAULT_MODEL_DIR, "resources.json")
+    if not os.path.exists(path):
+        stanza.download("uk")
+    with open(path, encoding="utf-8") as f:
+        resources = json.load(f)["uk"]
+    package = resources["default_processors"]["tokenize"]
+    return f"tokenize={package}/{resources['tokenize'][package]['md5']}"
+
+
+def open_tokenize_cache(path):
+    """Return SentenceCache of Stanza sentences and tokens, or None if `path` is None. """
+
+    if path is None:
+        return None
+    return SentenceCache(path, f"stanza/{stanza.__version__} uk/{model_version()}")
+
+
+def remove_views(out_dir, doc_ids):
+    """Remove derived files of documents that are no longer in the corpus. """
+
+    for doc_id in doc_ids:
+        for view in DERIVED_VIEWS:
+            for path in (out_dir / view).glob(f"{doc_id}.*"):
+                path.unlink()
+
+
+def merge_shards(shard_dirs, data_dir="./data", annotation_layer="gec-only"):
+    """Copy derived views produced by per-shard runs into `data_dir`.
+
+    Shards never share a document, so the result is identical to
+    a single-node run.
+    """
+
+    layer = ua_gec.AnnotationLayer(annotation_layer)
+    for shard_dir in shard_dirs:
+        for partition in ("train", "test"):
+            for view in DERIVED_VIEWS:
+                src_dir = Path(shard_dir) / layer.value / partition / view
+                if not src_dir.is_dir():
+                    continue
+                dst_dir = Path(data_dir) / layer.value / partition / view
+                dst_dir.mkdir(parents=True, exist_ok=True)
+                for path in src_dir.iterdir():
+                    shutil.copyfile(path, dst_dir / path.name)
 
-def main(data_dir="./data", annotation_layer="gec-only"):
-    annotation_layer = ua_gec.AnnotationLayer(annotation_layer)
-    data_dir = Path(data_dir) / annotation_layer.value
     for partition in ("train", "test"):
-        out_dir = data_dir / partition
-        print(f"~~~ Preprocess {partition} partition to {out_dir}")
-        corpus = ua_gec.Corpus(partition, annotation_layer=annotation_layer)
-        do_partition(out_dir, corpus)
+        corpus = ua_gec.Corpus(partition, annotation_layer=layer)
+        manifest = Manifest.build(corpus, tool_version())
+        manifest.save(Path(data_dir) / layer.value / partition / MANIFEST_NAME)
+
+
+def do_partition(out_dir, corpus, batch_size=DEFAULT_BATCH_SIZE, workers=1, cache=None):
+    """Write derived views of all documents in the corpus to `out_dir`.
+
+    See `do_partition_layers()`.
+    """
+
+    do_partition_layers([(out_dir, corpus)], batch_size, workers, cache)
+
+
+def do_partition_layers(jobs, batch_size=DEFAULT_BATCH_SIZE, workers=1, cache=None):
+    """Write derived views of a partition in one or more annotation layers.
 
+    Args:
+        jobs: list of (out_dir, corpus), one per layer.
+        batch_size: number of paragraphs or sentences passed to Stanza at once.
+        workers: number of worker processes.
+        cache (SentenceCache): Stanza results are read from and saved to it.
 
-def do_partition(out_dir, corpus):
+    All versions of a document (annotators and layers) are processed
+    together, so each unique text is split once. Their sources must be the
+    same, up to surrounding whitespace; ValueError is raised otherwise (see
+    `_check_sources()`).
 
-    for doc in tqdm.tqdm(corpus.get_documents()):
+    With `workers` > 1, chunks of documents are processed by a pool of
+    processes, each with its own Stanza pipeline. All versions of
+    a document are in the same chunk, since their sentences are realigned
+    together, and the files of a document are written by one worker only,
+    so the output is the same as with a single worker.
+    """
+
+    if workers <= 1:
+        _process_docs(jobs, batch_size, cache)
+        return
+
+    doc_ids = sorted({meta.doc_id for _, corpus in jobs for meta in corpus._get_metadata()})
+    chunks = [doc_ids[i:i + CHUNK_SIZE] for i in range(0, len(doc_ids), CHUNK_SIZE)]
+    stanza.download("uk")
+    # Workers open their own connection: sqlite connections must not be
+    # used across fork()
+    initargs = (jobs, batch_size, cache and cache.path)
+    with multiprocessing.Pool(workers, _init_worker, initargs) as pool:
+        results = pool.imap_unordered(_process_chunk, chunks)
+        for hits, misses in tqdm.tqdm(results, total=len(chunks)):
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+
+
+# Per-process state of pool workers
+_worker_jobs = None
+_worker_batch_size = None
+_worker_cache = None
+
+
+def _init_worker(jobs, batch_size, cache_path):
+    global _worker_jobs, _worker_batch_size, _worker_cache
+    _get_pipeline(download=False)
+    _worker_jobs = jobs
+    _worker_batch_size = batch_size
+    _worker_cache = open_tokenize_cache(cache_path)
+
+
+def _process_chunk(doc_ids):
+    """Process documents, return (hits, misses) of the cache. """
+
+    cache = _worker_cache
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    jobs = [(out_dir, corpus.select(doc_ids)) for out_dir, corpus in _worker_jobs]
+    _process_docs(jobs, _worker_batch_size, cache)
+    if cache is None:
+        return 0, 0
+    return cache.hits - hits, cache.misses - misses
+
+
+def _process_docs(jobs, batch_size, cache=None):
+    """Derive all views of the documents in memory, then write them.
+
+    Each document goes through sentence splitting, alignment, realignment
+    across its annotators (repeated until nothing changes) and
+    tokenization. Every output file is written once, atomically, after all
+    documents are processed, so an interrupted run leaves no partial files.
+    """
+
+    docs = [(out_dir, doc) for out_dir, corpus in jobs for doc in corpus.get_documents()]
+    _check_sources(docs)
+
+    # Sources are shared by annotators and layers, and most targets are
+    # the same in both layers
+    texts = list(dict.fromkeys(text for _, doc in docs for text in (doc.source, doc.target)))
+    split = dict(zip(texts, split_sentences_batch(texts, batch_size, cache, with_tokens=True)))
+    groups = collections.defaultdict(list)
+    for out_dir, doc in docs:
+        groups[out_dir, doc.doc_id].append(doc)
+
+    # Tokens of the splitting pass are only reused within a document (all
+    # of its versions), so that they don't depend on which other documents
+    # are processed together
+    tokenized_groups = []  # (views, sentence => tokens joined with spaces)
+    for (out_dir, _), group in tqdm.tqdm(groups.items()):
+        tokens = {}
+        for doc in group:
+            for sentence, sentence_tokens in split[doc.source] + split[doc.target]:
+                tokens.setdefault(sentence, sentence_tokens)
+        group = [(doc, [sentence for sentence, _ in split[doc.source]],
+                  [sentence for sentence, _ in split[doc.target]]) for doc in group]
+        doc_views = {out_dir / path: text for path, text in _process_doc(group, tokens).items()}
+        tokenized_groups.append((doc_views, tokens))
+
+    views = {}  # path => text
+    for doc_views, _ in tokenized_groups:
+        views.update(doc_views)
+    views.update(_tokenize_views(tokenized_groups, batch_size, cache))
+
+    for directory in sorted({path.parent for path in views}):
+        directory.mkdir(parents=True, exist_ok=True)
+    for path in sorted(views):
+        _write_atomic(path, views[path])
+
+
+def _check_sources(docs):
+    """Check that all versions of a document have the same source.
+
+    Raise ValueError if sources differ in more than surrounding whitespace
+    (which `validate.py` ignores). Otherwise, print a warning for every
+    version whose source isn't byte-identical to the first one: each
+    annotator's source is split as is, and `source/{doc_id}.src.txt` of a
+    layer is written from its last annotator.
+    """
+
+    first = {}
+    for out_dir, doc in docs:
+        other_dir, other = first.setdefault(doc.doc_id, (out_dir, doc))
+        if doc.source == other.source:
+            continue
+        versions = (f"a{other.meta.annotator_id} in {other_dir} and "
+                    f"a{doc.meta.annotator_id} in {out_dir}")
+        if doc.source.strip() != other.source.strip():
+            raise ValueError(f"Different sources of {doc.doc_id}: {versions}")
+        print(f"WARNING: Sources of {doc.doc_id} differ in surrounding whitespace: {versions}")
+
+
+def _process_doc(group, tokens=None):
+    """Return {path: text} of the text and sentence views of a document.
+
+    Args:
+        group: (document, source sentences, target sentences) of every
+            annotator of the document.
+        tokens: see `align_sentences()`.
+    """
 
-        src = split_sentences(doc.source)
-        tgt = split_sentences(doc.target)
-        output_src, output_tgt = align_sentences(src, tgt)
+    views = {}
+    for doc, src, tgt in group:
+        output_src, output_tgt = align_sentences(src, tgt, tokens)
         fname_src = f"{doc.doc_id}.src.txt"
         fname_tgt = f"{doc.doc_id}.a{doc.meta.annotator_id}.txt"
 
-        # Write source-only and target-only docs (with no annotations)
-        path_src = out_dir / "source" / fname_src
-        path_tgt = out_dir / "target" / fname_tgt
-        path_src.parent.mkdir(exist_ok=True)
-        path_tgt.parent.mkdir(exist_ok=True)
-        path_src.write_text(doc.source)
-        path_tgt.write_text(doc.target)
-
-        # Write sentence-level documents
-        path_src = out_dir / "source-sentences" / fname_src
-        path_tgt = out_dir / "target-sentences" / fname_tgt
-        path_src.parent.mkdir(exist_ok=True)
-        path_tgt.parent.mkdir(exist_ok=True)
-        path_src.write_text("\n".join(output_src))
-        path_tgt.write_text("\n".join(output_tgt))
+        # Source-only and target-only docs (with no annotations)
+        views[Path("source") / fname_src] = doc.source
+        views[Path("target") / fname_tgt] = doc.target
+
+        # Sentence-level documents
+        views[Path("source-sentences") / fname_src] = "\n".join(output_src)
+        views[Path("target-sentences") / fname_tgt] = "\n".join(output_tgt)
 
     for iteration in range(1, 4):
         num_affected = 0
-        num_affected += _realign_corpus_sentences_1(out_dir, corpus)
-        num_affected += _realign_corpus_sentences_2(out_dir, corpus)
-        #print(f"Iter {iteration}: realigned {num_affected} docs")
+        for doc, _, _ in group:
+            num_affected += _realign_sentences_1(views, doc, tokens)
+        for doc, _, _ in group:
+            num_affected += _realign_sentences_2(views, doc, tokens)
         if num_affected == 0:
             # May need a couple of iterations
             break
     else:
-        print(f"WARNING: Realign didn't converge for {corpus}")
+        print(f"WARNING: Realign didn't converge for {group[0][0].doc_id}")
 
-    _tokenize_corpus(out_dir, corpus)
+    return views
 
 
-def _realign_corpus_sentences_1(out_dir, corpus):
+def _realign_sentences_1(views, doc, tokens=None):
     """Fix sentence alignment for trailing newlines. """
 
     # Sometimes, the list of sentences may include newlines.
@@ -80,30 +363,26 @@ def _realign_corpus_sentences_1(out_dir, corpus):
     # and the target removes that, so the sentence is an empty line.
     # We need to realign these cases, but realign target to source.
 
-    num_affected = 0
-    for doc in tqdm.tqdm(corpus.get_documents()):
-        a = doc.meta.annotator_id
-        path_src = out_dir / "source-sentences" / f"{doc.doc_id}.src.txt"
-        path_tgt = out_dir / "target-sentences" / f"{doc.doc_id}.a{a}.txt"
-
-        src = path_src.read_text().split("\n")
-        tgt = path_tgt.read_text().strip().split("\n")
+    a = doc.meta.annotator_id
+    path_src = Path("source-sentences") / f"{doc.doc_id}.src.txt"
+    path_tgt = Path("target-sentences") / f"{doc.doc_id}.a{a}.txt"
 
-        if len(src) == len(tgt):
-            continue  # no problem here
+    src = views[path_src].split("\n")
+    tgt = views[path_tgt].strip().split("\n")
 
-        print(f"Realigning {doc.doc_id} (a{a})")
-        print(f"  old: {len(src)} -> {len(tgt)}")
-        tgt, src = align_sentences(tgt, src)
-        path_tgt.write_text("\n".join(tgt))
-        path_src.write_text("\n".join(src))
-        num_affected += 1
-        print(f"  new: {len(src)} -> {len(tgt)}")
+    if len(src) == len(tgt):
+        return 0  # no problem here
 
-    return num_affected
+    print(f"Realigning {doc.doc_id} (a{a})")
+    print(f"  old: {len(src)} -> {len(tgt)}")
+    tgt, src = align_sentences(tgt, src, tokens)
+    views[path_tgt] = "\n".join(tgt)
+    views[path_src] = "\n".join(src)
+    print(f"  new: {len(src)} -> {len(tgt)}")
+    return 1
 
 
-def _realign_corpus_sentences_2(out_dir, corpus):
+def _realign_sentences_2(views, doc, tokens=None):
     """Fix sentence alignment in case of two annotators changing
     the number of sentences in source.
     """
@@ -119,75 +398,102 @@ def _realign_corpus_sentences_2(out_dir, corpus):
     #
     # This function finds such cases and fixes them by joining some sentences
     # in whatever file out of (src, tgt1, tgt2) has more sentences.
-    num_affected = 0
-    for doc in tqdm.tqdm(corpus.get_documents()):
 
-        # The problem only occurs when there are two annotators
-        if doc.meta.annotator_id != 2:
-            continue
+    # The problem only occurs when there are two annotators
+    if doc.meta.annotator_id != 2:
+        return 0
+
+    path_src = Path("source-sentences") / f"{doc.doc_id}.src.txt"
+    path_tgt1 = Path("target-sentences") / f"{doc.doc_id}.a1.txt"
+    path_tgt2 = Path("target-sentences") / f"{doc.doc_id}.a2.txt"
+
+    src = views[path_src].split("\n")
+    tgt1 = views[path_tgt1].split("\n")
+    tgt2 = views[path_tgt2].split("\n")
+
+    if len(src) == len(tgt1) == len(tgt2):
+        return 0  # no problem here
 
-        path_src = out_dir / "source-sentences" / f"{doc.doc_id}.src.txt"
-        path_tgt1 = out_dir / "target-sentences" / f"{doc.doc_id}.a1.txt"
-        path_tgt2 = out_dir / "target-sentences" / f"{doc.doc_id}.a2.txt"
+    print(f"Fixing sentence alignment for {doc.doc_id}")
+    print(f"  src: {len(src)} sentences")
+    print(f" tgt1: {len(tgt1)} sentences")
+    print(f" tgt2: {len(tgt2)} sentences")
 
-        src = path_src.read_text().split("\n")
-        tgt1 = path_tgt1.read_text().split("\n")
-        tgt2 = path_tgt2.read_text().split("\n")
+    # Make sure the source has joined sentences
+    if len(src) > len(tgt1):
+        src, tgt1 = align_sentences(src, tgt1, tokens)
+    if len(src) > len(tgt2):
+        src, tgt2 = align_sentences(src, tgt2, tokens)
 
-        if len(src) == len(tgt1) == len(tgt2):
-            continue  # no problem here
-        
-        num_affected += 1
-        print(f"Fixing sentence alignment for {doc.doc_id}")
+    # Make sure that both tagets match the source
+    if len(tgt1) > len(src):
+        src, tgt1 = align_sentences(src, tgt1, tokens)
+    if len(tgt2) > len(src):
+        src, tgt2 = align_sentences(src, tgt2, tokens)
+
+    if not (len(src) == len(tgt1) == len(tgt2)):
+        print("  FAILED TO FIX ALIGNMENT")
         print(f"  src: {len(src)} sentences")
         print(f" tgt1: {len(tgt1)} sentences")
         print(f" tgt2: {len(tgt2)} sentences")
 
-        # Make sure the source has joined sentences
-        if len(src) > len(tgt1):
-            src, tgt1 = align_sentences(src, tgt1)
-        if len(src) > len(tgt2):
-            src, tgt2 = align_sentences(src, tgt2)
+    # Store the fixed files
+    views[path_src] = "\n".join(src) + "\n"
+    views[path_tgt1] = "\n".join(tgt1) + "\n"
+    views[path_tgt2] = "\n".join(tgt2) + "\n"
+    return 1
 
-        # Make sure that both tagets match the source
-        if len(tgt1) > len(src):
-            src, tgt1 = align_sentences(src, tgt1)
-        if len(tgt2) > len(src):
-            src, tgt2 = align_sentences(src, tgt2)
 
-        if not (len(src) == len(tgt1) == len(tgt2)):
-            print("  FAILED TO FIX ALIGNMENT")
-            print(f"  src: {len(src)} sentences")
-            print(f" tgt1: {len(tgt1)} sentences")
-            print(f" tgt2: {len(tgt2)} sentences")
+def _tokenize_views(groups, batch_size=DEFAULT_BATCH_SIZE, cache=None):
+    """Return {path: text} of tokenized sentence views.
 
-        # Write the fixed files
-        path_src.write_text("\n".join(src) + "\n")
-        path_tgt1.write_text("\n".join(tgt1) + "\n")
-        path_tgt2.write_text("\n".join(tgt2) + "\n")
+    Args:
+        groups: (views, tokens) of every document, where `tokens` maps its
+            sentences to their tokens from the splitting pass.
 
-    return num_affected
+    Sentences found in the tokens of their own document reuse them. The rest
+    are passed to Stanza again, each on its own, so their tokens only
+    depend on the sentence.
+    """
 
+    sentences = {}  # path => (sentences, tokens of the document)
+    for views, tokens in groups:
+        for path, text in views.items():
+            view = path.parent.name
+            if view in ("source-sentences", "target-sentences"):
+                tokenized_path = path.parent.parent / f"{view}-tokenized" / path.name
+                sentences[tokenized_path] = (text.split("\n"), tokens)
 
-def _tokenize_corpus(out_dir, corpus):
-    """Write tokenized sentences. """
+    missing = list(dict.fromkeys(
+        s for sents, tokens in sentences.values() for s in sents if s not in tokens))
+    tokenized = dict(zip(missing, tokenize_batch(missing, batch_size, cache)))
+
+    return {
+        path: "\n".join(tokens[s] if s in tokens else tokenized[s] for s in sents)
+        for path, (sents, tokens) in sentences.items()
+    }
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def align_sentences(src_sentences, tgt_sentences, tokens=None):
+    """Align sentences, joining some of them into one.
+
+    At each step, up to six ways to join the next source and target
+    sentences are compared by the edit distance of the joined texts. The
+    distance is computed in order of a cheap lower bound, and candidates
+    whose bound shows they can't beat the best one are skipped, so the
+    result is the same as comparing all of them.
+
+    If `tokens` is given (sentence => tokens joined with spaces), tokens of
+    every joined sentence whose parts are all known are added to it.
+    """
 
-    for doc in tqdm.tqdm(corpus.get_documents()):
-        fname_src = f"{doc.doc_id}.src.txt"
-        fname_tgt = f"{doc.doc_id}.a{doc.meta.annotator_id}.txt"
-        path_src = out_dir / "source-sentences-tokenized" / fname_src
-        path_tgt = out_dir / "target-sentences-tokenized" / fname_tgt
-        src_sents = (out_dir / "source-sentences" / fname_src).read_text().split("\n")
-        tgt_sents = (out_dir / "target-sentences" / fname_tgt).read_text().split("\n")
-        path_src.parent.mkdir(exist_ok=True)
-        path_tgt.parent.mkdir(exist_ok=True)
-        tokenized_src = [tokenize(s) for s in src_sents]
-        tokenized_tgt = [tokenize(s) for s in tgt_sents]
-        path_src.write_text("\n".join(tokenized_src))
-        path_tgt.write_text("\n".join(tokenized_tgt))
-
-
-def align_sentences(src_sentences, tgt_sentences):
     combinations = [
         (1, 1),
         (1, 2),
@@ -196,60 +502,214 @@ def align_sentences(src_sentences, tgt_sentences):
         (3, 1),
         (2, 2),
     ]
+    src_joined = _JoinedSentences(src_sentences)
+    tgt_joined = _JoinedSentences(tgt_sentences)
     result_src = []
     result_tgt = []
     pos_src = 0
     pos_tgt = 0
     while pos_src < len(src_sentences):
-        min_dist = 10e9
-        best_take_src = None
-        best_take_tgt = None
-        best_src = None
-        best_tgt = None
-        for take_src, take_tgt in combinations:
+        candidates = []
+        seen = set()
+        for index, (take_src, take_tgt) in enumerate(combinations):
 
             # If take_src reaches the end of source, make sure that we
             # reach the end of target as well
             if pos_src + take_src >= len(src_sentences):
                 take_tgt = len(tgt_sentences) - pos_tgt
 
-            src = " ".join(src_sentences[pos_src : pos_src + take_src])
-            tgt = " ".join(tgt_sentences[pos_tgt : pos_tgt + take_tgt])
+            src_span = src_joined.span(pos_src, pos_src + take_src)
+            tgt_span = tgt_joined.span(pos_tgt, pos_tgt + take_tgt)
+            if (src_span, tgt_span) in seen:
+                continue  # same texts as an earlier candidate, which wins ties
+            seen.add((src_span, tgt_span))
+
+            src, src_counts = src_joined.get(*src_span)
+            tgt, tgt_counts = tgt_joined.get(*tgt_span)
+            bound = _distance_lower_bound(src, tgt, src_counts, tgt_counts)
+            candidates.append((bound, index, take_src, take_tgt, src, tgt))
+
+        # Ties are resolved in favor of the earlier combination
+        best = None
+        for bound, index, take_src, take_tgt, src, tgt in sorted(candidates):
+            if best is not None and (bound, index) > best[:2]:
+                break  # neither this nor any later candidate can win
             dist = damerau_levenshtein_distance(src, tgt)
-            if dist < min_dist:
-                min_dist = dist
-                best_take_src = take_src
-                best_take_tgt = take_tgt
-                best_src = src
-                best_tgt = tgt
+            if best is None or (dist, index) < best[:2]:
+                best = (dist, index, take_src, take_tgt, src, tgt)
+        _, _, best_take_src, best_take_tgt, best_src, best_tgt = best
+
+        if tokens is not None:
+            _join_tokens(tokens, src_sentences[pos_src : pos_src + best_take_src], best_src)
+            _join_tokens(tokens, tgt_sentences[pos_tgt : pos_tgt + best_take_tgt], best_tgt)
         pos_src += best_take_src
         pos_tgt += best_take_tgt
+        src_joined.forget(pos_src)
+        tgt_joined.forget(pos_tgt)
         result_src.append(best_src)
         result_tgt.append(best_tgt)
     assert len(result_src) == len(result_tgt)
     return result_src, result_tgt
 
 
+class _JoinedSentences:
+    """Sentences[start:end] joined with spaces, and their character counts.
+
+    Joined texts are built from shorter ones with the same start, so each
+    sentence is counted once.
+    """
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self._cache = {}  # (start, end) => (text, Counter)
+
+    def span(self, start, end):
+        """Return (start, end) of the slice `sentences[start:end]`. """
+
+        return start, max(start, min(end, len(self.sentences)))
+
+    def get(self, start, end):
+        key = (start, end)
+        if key not in self._cache:
+            # Extend the longest cached prefix
+            i = end
+            while i > start and (start, i) not in self._cache:
+                i -= 1
+            text, counts = self._cache.get((start, i), ("", collections.Counter()))
+            for j in range(i, end):
+                sentence = self.sentences[j]
+                counts = counts + collections.Counter(sentence)
+                if j > start:
+                    text = f"{text} {sentence}"
+                    counts[" "] += 1
+                else:
+                    text = sentence
+                self._cache[start, j + 1] = (text, counts)
+            self._cache[key] = (text, counts)
+        return self._cache[key]
+
+    def forget(self, pos):
+        """Drop joined texts that start before `pos`. """
+
+        for key in [key for key in self._cache if key[0] < pos]:
+            del self._cache[key]
+
+
+def _distance_lower_bound(a, b, counts_a, counts_b):
+    """Lower bound of the Damerau-Levenshtein distance between `a` and `b`.
+
+    Insertions and deletions change the length and the character counts by
+    one, substitutions change the counts by two, and transpositions change
+    neither, so any edit reduces (count difference + length difference) by
+    at most two.
+    """
+
+    count_diff = sum(((counts_a - counts_b) + (counts_b - counts_a)).values())
+    return (count_diff + abs(len(a) - len(b)) + 1) // 2
+
+
+def _join_tokens(tokens, parts, joined):
+    if len(parts) > 1 and joined not in tokens and all(part in tokens for part in parts):
+        tokens[joined] = " ".join(tokens[part] for part in parts if tokens[part])
+
+
 def split_sentences(text: str) -> [str]:
-    sentences = []
-    if not hasattr(split_sentences, "nlp"):
-        stanza.download("uk")
-        split_sentences.nlp = stanza.Pipeline(lang="uk", processors="tokenize")
-    nlp = split_sentences.nlp
+    return split_sentences_batch([text])[0]
+
+
+def split_sentences_batch(texts, batch_size=DEFAULT_BATCH_SIZE, cache=None, with_tokens=False):
+    """Split each text into sentences, like `split_sentences()`.
+
+    Every line of a text is split separately, but lines of many texts
+    are passed to Stanza together. For `cache`, see `_process_paragraphs()`.
+
+    Returns:
+        list: sentences of each text, or (sentence, tokens joined with
+        spaces) pairs if `with_tokens` is True.
+    """
 
-    for paragraph in text.split("\n"):
-        sentences += [s.text for s in nlp(paragraph).sentences]
+    paragraphs = []
+    text_indexes = []
+    for i, text in enumerate(texts):
+        for paragraph in text.split("\n"):
+            paragraphs.append(paragraph)
+            text_indexes.append(i)
 
-    return sentences
+    result = [[] for _ in texts]
+    for i, sentences in zip(text_indexes, _process_paragraphs(paragraphs, batch_size, cache)):
+        result[i] += sentences if with_tokens else [text for text, _ in sentences]
+    return result
 
 
 def tokenize(text: str) -> [str]:
-    if not hasattr(tokenize, "nlp"):
-        tokenize.nlp = stanza.Pipeline(lang="uk", processors="tokenize")
-    nlp = tokenize.nlp
+    return tokenize_batch([text])[0]
 
-    tokenized = " ".join([t.text for t in nlp(text).iter_tokens()])
-    return tokenized
+
+def tokenize_batch(texts, batch_size=DEFAULT_BATCH_SIZE, cache=None):
+    """Tokenize single-line texts, like `tokenize()`. Return tokens joined with spaces. """
+
+    return [
+        " ".join(sentence_tokens for _, sentence_tokens in sentences)
+        for sentences in _process_paragraphs(texts, batch_size, cache)
+    ]
+
+
+def _process_paragraphs(paragraphs, batch_size, cache=None):
+    """Run Stanza over single-line paragraphs, `batch_size` at a time.
+
+    Paragraphs of a batch are joined with blank lines, which Stanza treats
+    as paragraph boundaries, so the result is the same as processing them
+    one by one. Sentences are mapped back to their paragraphs by offsets.
+
+    Each unique paragraph is processed once. Paragraphs found in `cache`
+    (SentenceCache) aren't processed at all, and new results are saved to
+    it. Sentence splitting and tokenization share the cache: a sentence
+    tokenized on its own is a paragraph too.
+
+    Returns:
+        list: (text, tokens joined with spaces) of the sentences of each
+        paragraph.
+    """
+
+    unique = list(dict.fromkeys(paragraphs))
+    found = {}
+    if cache is not None:
+        for paragraph, data in cache.get_many(unique).items():
+            found[paragraph] = [tuple(sentence) for sentence in json.loads(data)]
+    todo = [paragraph for paragraph in unique if paragraph not in found]
+
+    new = {paragraph: [] for paragraph in todo}
+    if todo:
+        nlp = _get_pipeline()
+    for batch_start in range(0, len(todo), batch_size):
+        batch = todo[batch_start:batch_start + batch_size]
+        starts = []
+        offset = 0
+        for paragraph in batch:
+            starts.append(offset)
+            offset += len(paragraph) + 2
+
+        doc = nlp("\n\n".join(batch))
+        for sentence in doc.sentences:
+            i = bisect.bisect_right(starts, sentence.tokens[0].start_char) - 1
+            sentence_tokens = " ".join(t.text for t in sentence.tokens)
+            new[batch[i]].append((sentence.text, sentence_tokens))
+
+    if cache is not None and new:
+        cache.put_many({
+            paragraph: json.dumps(sentences, ensure_ascii=False).encode("utf-8")
+            for paragraph, sentences in new.items()
+        })
+    found.update(new)
+    return [found[paragraph] for paragraph in paragraphs]
+
+
+def _get_pipeline(download=True):
+    if not hasattr(_get_pipeline, "nlp"):
+        if download:
+            stanza.download("uk")
+        _get_pipeline.nlp = stanza.Pipeline(lang="uk", processors="tokenize")
+    return _get_pipeline.nlp
 
 
 if __name__ == "__main__":
@@ -257,8 +717,34 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--path", default="./data")
-    parser.add_argument("--annotation-layer",
+    parser.add_argument("--annotation-layer", nargs="+",
                         choices=[x.value for x in ua_gec.AnnotationLayer],
-                        required=True)
+                        required=True,
+                        help="one or more layers; sources shared by the layers "
+                             "are split once")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="process only shard I of N (0-based), e.g. 0/4")
+    parser.add_argument("--merge", nargs="+", metavar="SHARD_DIR",
+                        help="copy views written by per-shard runs (each with its "
+                             "own --path) into --path")
+    parser.add_argument("--full", action="store_true",
+                        help="reprocess all documents, not only the changed ones")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of paragraphs or sentences passed to Stanza at once")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes, each with its own Stanza pipeline")
+    parser.add_argument("--tokenize-cache", default=DEFAULT_TOKENIZE_CACHE,
+                        help="sqlite file with cached Stanza sentences and tokens, shared "
+                             "by all runs (default: %(default)s)")
+    parser.add_argument("--no-tokenize-cache", action="store_true",
+                        help="run Stanza on all text, don't read or write the cache")
     args = parser.parse_args()
-    main(args.path, args.annotation_layer)
+    if stanza is None:
+        parser.error("Stanza is not installed")
+    if args.merge:
+        for layer in args.annotation_layer:
+            merge_shards(args.merge, args.path, layer)
+    else:
+        tokenize_cache = None if args.no_tokenize_cache else args.tokenize_cache
+        main(args.path, args.annotation_layer, args.shard, args.full, args.batch_size,
+             args.workers, tokenize_cache)
@@ -1,139 +1,633 @@
 #!/usr/bin/env python3
 """Validate data for consistency.
-"""
 
+All checks run in a single streaming pass over the corpus. A check
+implements hooks that are called for every document (with all its layers
+and annotators at once), for every annotation, and for every edit of the
+M2 files. With `--workers`, shards of documents are validated in parallel.
+
+Results are cached (`--cache`) by the content hashes of the files that
+each check reads: the annotated files and sentence views of all annotators
+and layers of a document. Only documents whose inputs changed are read and
+validated again. Results of the M2 hooks are cached by the hash of the M2
+file and what they depend on (e.g., the error types of the annotations).
+
+Problems are printed per check and optionally written as JSON
+(`--report`). The exit status is 1 if any check of "error" severity found
+problems (with `--strict`, warnings count too).
+"""
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
 from textwrap import shorten
-from collections import defaultdict
+
 from ua_gec import Corpus, AnnotationLayer
+from ua_gec.corpus import is_gec_only
+from ua_gec.m2 import M2Reader
 
+LAYERS = (AnnotationLayer.GecAndFluency, AnnotationLayer.GecOnly)
 
+CACHE_VERSION = "validate/1"
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "ua_gec", "validation.json")
 
-def check_files_without_annotations(corpus):
-    missing_by_partition = defaultdict(list)
-    exceptions = ["0460", "0650", "1875", "1880"]
-    for doc in corpus:
-        if not doc.annotated.get_annotations() and not doc.doc_id in exceptions:
-            part = doc.meta.partition
-            missing_by_partition[part].append(doc.doc_id)
-
-    if missing_by_partition:
-        for part, doc_ids in missing_by_partition.items():
-            print(f"Annotations missing in the {part}:")
-            print("\n".join(doc_ids))
-            print()
-
-    return not missing_by_partition
-
-
-def check_files_with_missing_detailed_annotations(corpus):
-    reannotate = set()
-    for doc in corpus:
-        for ann in doc.annotated.get_annotations():
-            if "error_type" not in ann.meta:
-                print(f"Missing error_type in {doc.doc_id}: {ann}")
-                continue
-            if ann.meta["error_type"] in ("Grammar", "Fluency"):
-                reannotate.add(doc.doc_id)
 
-    if reannotate:
-        print(f"{len(reannotate)} docs with missing detailed annotations:")
-        print(", ".join(sorted(reannotate)))
+class DocumentVersions:
+    """All versions of a document.
 
+    Attributes:
+        doc_id (str): the document.
+        partition (str): "train" or "test".
+        layers (dict): AnnotationLayer => {annotator_id: Document}.
+    """
 
-def check_double_annotated(corpus):
-    """Docs with 2 annotators should have exactly the same source. """
+    def __init__(self, doc_id, partition):
+        self.doc_id = doc_id
+        self.partition = partition
+        self.layers = {layer: {} for layer in LAYERS}
 
-    broken = []
-    for doc in corpus:
-        if doc.meta.annotator_id == 2:
-            doc_2 = corpus.get_doc(doc.doc_id, annotator_id=1)
-            if doc.source.strip() != doc_2.source.strip():
-                broken.append(doc.doc_id)
+    def __iter__(self):
+        """Iterate over (layer, Document) of all versions. """
 
-    if broken:
-        print(f"{len(broken)} docs have different source in annotator 1 and annotator 2:")
-        print(', '.join(sorted(broken)))
+        for layer in LAYERS:
+            for doc in self.layers[layer].values():
+                yield layer, doc
 
 
-def check_gec_only_and_gec_fluency_source_match():
-    """Check that GEC-only and GEC-Fluency has the same number of source sentences. """
+class Check:
+    """Base class of validation checks.
 
-    corpus_gec = Corpus("all", annotation_layer=AnnotationLayer.GecOnly)
-    corpus_fluency = Corpus("all", annotation_layer=AnnotationLayer.GecAndFluency)
+    Subclasses override any of the `visit_*` hooks. Hooks return an
+    iterable of problems (strings) or None. Document and annotation hooks
+    must only depend on the document and on the files listed in `inputs`
+    and `layers`, because their results are cached by the hashes of these
+    files. Facts needed across documents are returned by `summarize()`,
+    which is cached too, and collected by `absorb()`.
+    """
 
-    broken = []
-    for doc1, doc2 in zip(corpus_fluency, corpus_gec):
-        if doc1.source.strip() != doc2.source.strip():
-            broken.append(f"{doc1.doc_id}.annotator_id={doc1.meta.annotator_id}")
+    name = None
+    version = 1  # increment to invalidate cached results of the check
+    severity = "error"  # or "warning"
+    heading = "{n} problems:"  # printed before the problems
+    separator = ", "
+    width = None  # shorten the printed problems to this many characters
 
-    if broken:
-        print(f"{len(broken)} docs have different source in GEC-only and GEC-Fluency:")
-        print(', '.join(sorted(broken)))
+    # Views read by the document and annotation hooks, and their layers
+    inputs = ("annotated",)
+    layers = LAYERS
 
+    def __init__(self):
+        self.problems = []
 
-def check_number_of_source_and_target_sentences():
-    """Check that the number of source and target sentences match. """
+    def visit_document(self, versions):
+        """Called once per document with all its versions. """
 
-    for layer in (AnnotationLayer.GecOnly, AnnotationLayer.GecAndFluency):
-        corpus = Corpus("all", annotation_layer=layer)
-        broken = []
-        for doc in corpus:
-            msg = f"{doc.doc_id}.annotator_id={doc.meta.annotator_id} ({layer})"
-            if len(doc.source_sentences) != len(doc.target_sentences):
-                broken.append(msg)
-            if len(doc.source_sentences_tokenized) != len(doc.target_sentences_tokenized):
-                broken.append(msg)
+    def visit_annotation(self, layer, doc, ann):
+        """Called for every annotation of every version of a document. """
 
-        if broken:
-            print(f"{len(broken)} docs have different number of source and target sentences:")
-            print(', '.join(sorted(broken)))
+    def visit_m2_file(self, layer, partition, path):
+        """Called for every M2 file after all documents, even if it doesn't exist. """
 
+    def visit_m2_edit(self, layer, partition, edit):
+        """Called for every edit of an M2 file, noop edits included. """
 
-def check_m2_error_types():
-    """Check that error types are copied into .m2 files. """
+    def summarize(self, versions):
+        """Return JSON-serializable facts about a document, or None. """
 
-    for layer in (AnnotationLayer.GecOnly, AnnotationLayer.GecAndFluency):
-        for partition in ("train", "test"):
-            corpus = Corpus(partition, annotation_layer=layer)
-            known_categories = {"noop", "Other"}
-            for doc in corpus:
-                for ann in doc.annotated.get_annotations():
-                    known_categories.add(ann.meta["error_type"])
-
-            fname = f"{layer.value}.{partition}.m2"
-            m2_path = corpus.data_dir / partition / fname
-            for line in m2_path.read_text(encoding="utf-8").splitlines():
-                if line.startswith("A"):
-                    category = line.split("|||")[1]
-                    if category not in known_categories:
-                        print(f"Unknown category in {fname}: {category}")
-
-
-def check_fluency_in_gec_only():
+    def absorb(self, summary):
+        """Add facts returned by `summarize()` for a document. """
+
+    def m2_context(self, layer, partition):
+        """Return JSON-serializable state that the M2 hooks depend on. """
+
+    def to_dict(self):
+        problems = sorted(set(self.problems))
+        return {
+            "severity": self.severity,
+            "passed": not problems,
+            "problems": problems,
+        }
+
+    def print(self):
+        problems = sorted(set(self.problems))
+        if not problems:
+            return
+        print(self.heading.format(n=len(problems)))
+        text = self.separator.join(problems)
+        print(shorten(text, width=self.width) if self.width else text)
+        print()
+
+
+def _doc_key(doc):
+    return f"{doc.doc_id}.annotator_id={doc.meta.annotator_id}"
+
+
+class FluencyInGecOnly(Check):
     """Check that gec-only does not contain any fluency edits. """
 
-    corpus = Corpus("all", annotation_layer=AnnotationLayer.GecOnly)
-    broken = set()
-    for doc in corpus:
-        for ann in doc.annotated.get_annotations():
-            if ann.meta["error_type"].startswith("F/"):
-                broken.add(f"{doc.doc_id}.annotator_id={doc.meta.annotator_id}")
+    name = "fluency_in_gec_only"
+    heading = "{n} docs have fluency edits in GEC-only:"
+    width = 200
+    layers = (AnnotationLayer.GecOnly,)
+
+    def visit_annotation(self, layer, doc, ann):
+        if layer == AnnotationLayer.GecOnly and ann.meta.get("error_type", "").startswith("F/"):
+            return [_doc_key(doc)]
+
+
+class GecOnlyProjection(Check):
+    """Diff gec-fluency minus fluency edits against the stored gec-only layer. """
+
+    name = "gec_only_projection"
+    severity = "warning"
+    heading = "{n} docs differ between the gec-only projection and GEC-only:"
+    width = 200
+
+    def visit_document(self, versions):
+        problems = []
+        gec_only = versions.layers[AnnotationLayer.GecOnly]
+        for annotator_id, doc in versions.layers[AnnotationLayer.GecAndFluency].items():
+            if annotator_id not in gec_only:
+                continue
+            keep = lambda ann: is_gec_only(ann.meta.get("error_type", ""))
+            projected = doc.annotated.filter_annotations(keep)
+            stored = gec_only[annotator_id].annotated
+            anns1 = set(projected.get_annotations())
+            anns2 = set(stored.get_annotations())
+            if projected.get_original_text() != stored.get_original_text() or anns1 != anns2:
+                problems.append(f"{_doc_key(doc)} ({len(anns2 - anns1)} annotations "
+                                f"missing, {len(anns1 - anns2)} extra)")
+        return problems
+
+
+class M2ErrorTypes(Check):
+    """Check that error types are copied into .m2 files. """
+
+    name = "m2_error_types"
+    version = 2
+    heading = "{n} unknown categories or missing files in .m2 files:"
+    separator = "\n"
+
+    def __init__(self):
+        super().__init__()
+        self.known = collections.defaultdict(lambda: {"noop", "Other"})  # (layer, partition) => error types
+
+    def summarize(self, versions):
+        types = collections.defaultdict(set)
+        for layer, doc in versions:
+            for ann in doc.annotated.get_annotations():
+                types[layer.value].add(ann.meta.get("error_type", "MISSING"))
+        return [versions.partition, {layer: sorted(t) for layer, t in types.items()}]
+
+    def absorb(self, summary):
+        partition, types = summary
+        for layer, layer_types in types.items():
+            self.known[layer, partition].update(layer_types)
+
+    def m2_context(self, layer, partition):
+        return sorted(self.known[layer.value, partition])
 
-    if broken:
-        print(f"{len(broken)} docs have fluency edits in GEC-only:")
-        print(shorten(', '.join(sorted(broken)), width=200))
+    def visit_m2_file(self, layer, partition, path):
+        if not path.exists():
+            return [f"{path.name}: file not found"]
+
+    def visit_m2_edit(self, layer, partition, edit):
+        # Native edits may combine the types of several annotations
+        if not set(edit.type.split("+")) <= self.known[layer.value, partition]:
+            return [f"Unknown category in {layer.value}.{partition}.m2: {edit.type}"]
+
+
+class FilesWithoutAnnotations(Check):
+
+    name = "files_without_annotations"
+    heading = "{n} docs have no annotations:"
+    layers = (AnnotationLayer.GecAndFluency,)
+    exceptions = ["0460", "0650", "1875", "1880"]
+
+    def visit_document(self, versions):
+        problems = []
+        for doc in versions.layers[AnnotationLayer.GecAndFluency].values():
+            if not doc.annotated.get_annotations() and doc.doc_id not in self.exceptions:
+                problems.append(f"{doc.doc_id} ({doc.meta.partition})")
+        return problems
+
+
+class MissingErrorType(Check):
+
+    name = "missing_error_type"
+    heading = "{n} annotations have no error_type:"
+    separator = "\n"
+    layers = (AnnotationLayer.GecAndFluency,)
+
+    def visit_annotation(self, layer, doc, ann):
+        if layer == AnnotationLayer.GecAndFluency and "error_type" not in ann.meta:
+            return [f"{doc.doc_id}: {ann}"]
+
+
+class MissingDetailedAnnotations(Check):
+
+    name = "missing_detailed_annotations"
+    severity = "warning"
+    heading = "{n} docs with missing detailed annotations:"
+    layers = (AnnotationLayer.GecAndFluency,)
+
+    def visit_annotation(self, layer, doc, ann):
+        if (layer == AnnotationLayer.GecAndFluency
+                and ann.meta.get("error_type") in ("Grammar", "Fluency")):
+            return [doc.doc_id]
+
+
+class DoubleAnnotated(Check):
+    """Docs with 2 annotators should have exactly the same source. """
+
+    name = "double_annotated"
+    heading = "{n} docs have different source in annotator 1 and annotator 2:"
+    layers = (AnnotationLayer.GecAndFluency,)
+
+    def visit_document(self, versions):
+        docs = versions.layers[AnnotationLayer.GecAndFluency]
+        if 1 in docs and 2 in docs and docs[1].source.strip() != docs[2].source.strip():
+            return [versions.doc_id]
+
+
+class LayersSourceMatch(Check):
+    """Check that GEC-only and GEC-Fluency have the same source. """
+
+    name = "gec_only_and_gec_fluency_source_match"
+    version = 2
+    heading = "{n} docs have different source in GEC-only and GEC-Fluency:"
+
+    def visit_document(self, versions):
+        problems = []
+        gec_fluency = versions.layers[AnnotationLayer.GecAndFluency]
+        gec_only = versions.layers[AnnotationLayer.GecOnly]
+        for annotator_id in sorted(set(gec_fluency) | set(gec_only)):
+            doc = gec_fluency.get(annotator_id)
+            other = gec_only.get(annotator_id)
+            if doc is None or other is None or doc.source.strip() != other.source.strip():
+                problems.append(_doc_key(doc or other))
+        return problems
+
+
+class NumberOfSentences(Check):
+    """Check that the number of source and target sentences match. """
+
+    name = "number_of_source_and_target_sentences"
+    heading = "{n} docs have different number of source and target sentences:"
+    inputs = (
+        "source-sentences",
+        "target-sentences",
+        "source-sentences-tokenized",
+        "target-sentences-tokenized",
+    )
+
+    def visit_document(self, versions):
+        problems = []
+        for layer, doc in versions:
+            if (len(doc.source_sentences) != len(doc.target_sentences)
+                    or len(doc.source_sentences_tokenized) != len(doc.target_sentences_tokenized)):
+                problems.append(f"{_doc_key(doc)} ({layer.value})")
+        return problems
+
+
+CHECKS = (
+    FluencyInGecOnly,
+    GecOnlyProjection,
+    M2ErrorTypes,
+    FilesWithoutAnnotations,
+    MissingErrorType,
+    MissingDetailedAnnotations,
+    DoubleAnnotated,
+    LayersSourceMatch,
+    NumberOfSentences,
+)
+
+
+def iter_versions(doc_ids=None):
+    """Yield DocumentVersions of all documents, reading each file once.
+
+    Versions are matched by doc_id and annotator_id. A document whose
+    annotated file is missing in a layer has no version in that layer.
+    """
+
+    layer_groups = []
+    for layer in LAYERS:
+        corpus = Corpus("all", annotation_layer=layer)
+        if doc_ids is not None:
+            corpus = corpus.select(doc_ids)
+        corpus = corpus._subset(
+            meta for meta in corpus._get_metadata() if corpus._annotated_path(meta).exists())
+        groups = itertools.groupby(corpus.iter_documents(), key=lambda doc: doc.doc_id)
+        layer_groups.append((layer, groups))
+
+    # Layers are read in lockstep. They list documents in the same order,
+    # so a document is usually complete as soon as the last layer reads it
+    pending = {}  # doc_id => (DocumentVersions, layers not read yet)
+    for groups in itertools.zip_longest(*(groups for _, groups in layer_groups)):
+        for (layer, _), group in zip(layer_groups, groups):
+            if group is None:
+                continue
+            doc_id, docs = group
+            docs = list(docs)
+            if doc_id not in pending:
+                pending[doc_id] = (DocumentVersions(doc_id, docs[0].meta.partition), set(LAYERS))
+            versions, remaining = pending[doc_id]
+            for doc in docs:
+                versions.layers[layer][doc.meta.annotator_id] = doc
+            remaining.discard(layer)
+            if not remaining:
+                yield pending.pop(doc_id)[0]
+
+    # Documents missing from some layer
+    for versions, _ in pending.values():
+        yield versions
+
+
+def check_documents(doc_ids):
+    """Run the document and annotation hooks of all checks.
+
+    Returns:
+        dict: doc_id => {check name: {"problems": [...], "summary": ...}}.
+    """
+
+    checks = [check_class() for check_class in CHECKS]
+    document_hooks = _hooks(checks, "visit_document")
+    annotation_hooks = _hooks(checks, "visit_annotation")
+
+    results = {}
+    for versions in iter_versions(doc_ids):
+        result = {
+            check.name: {"problems": [], "summary": check.summarize(versions)}
+            for check in checks
+        }
+        for check, hook in document_hooks:
+            result[check.name]["problems"] += hook(versions) or []
+        for layer, doc in versions:
+            for ann in doc.annotated.get_annotations():
+                for check, hook in annotation_hooks:
+                    result[check.name]["problems"] += hook(layer, doc, ann) or []
+        results[versions.doc_id] = result
+    return results
+
+
+def validate(workers=1, cache=None):
+    """Run all checks over the corpus and the M2 files.
+
+    Args:
+        workers (int): number of processes validating documents.
+        cache (ValidationCache, optional): results of previous runs. Only
+            documents and M2 files whose inputs changed are validated; the
+            cache is updated in place.
+
+    Returns:
+        list: the checks, with their problems.
+    """
+
+    if cache is None:
+        cache = ValidationCache()
+    checks = [check_class() for check_class in CHECKS]
+    corpora = [Corpus("all", annotation_layer=layer) for layer in LAYERS]
+    file_hashes = FileHashes(cache.files)
+
+    keys = _document_keys(checks, corpora, file_hashes)
+    todo = sorted(
+        doc_id for doc_id, doc_keys in keys.items()
+        if any(key not in cache.documents for key in doc_keys.values()))
+    if workers > 1 and len(todo) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            fresh = {}
+            for results in pool.map(check_documents, [todo[i::workers] for i in range(workers)]):
+                fresh.update(results)
+    else:
+        fresh = check_documents(todo)
+
+    documents = {}
+    for doc_id, doc_keys in keys.items():
+        for check in checks:
+            key = doc_keys[check.name]
+            result = fresh[doc_id][check.name] if doc_id in fresh else cache.documents[key]
+            documents[key] = result
+            check.problems.extend(result["problems"])
+            check.absorb(result["summary"])
+
+    m2 = _validate_m2(checks, cache.m2, file_hashes)
+    print(f"Validated {len(todo)} of {len(keys)} documents "
+          f"and {m2.validated} of {m2.total} M2 results")
+
+    cache.documents = documents
+    cache.m2 = m2.results
+    cache.files = file_hashes.current
+    return checks
+
+
+M2Results = collections.namedtuple("M2Results", "results validated total")
+
+
+def _validate_m2(checks, cached, file_hashes):
+    """Run the M2 hooks of all checks over the M2 files. Return M2Results. """
+
+    m2_checks = [
+        check for check in checks
+        if type(check).visit_m2_file is not Check.visit_m2_file
+        or type(check).visit_m2_edit is not Check.visit_m2_edit
+    ]
+    results = {}
+    validated = 0
+    for layer in LAYERS:
+        for partition in ("train", "test"):
+            path = Corpus(partition, annotation_layer=layer).data_dir / partition / \
+                f"{layer.value}.{partition}.m2"
+            m2_hash = file_hashes.get(path)
+
+            todo = {}
+            for check in m2_checks:
+                key = _hash([check.name, check.version, layer.value, partition, m2_hash,
+                             check.m2_context(layer, partition)])
+                if key in cached:
+                    results[key] = cached[key]
+                else:
+                    todo[key] = check
+                    results[key] = list(check.visit_m2_file(layer, partition, path) or [])
+            if todo and path.exists():
+                with M2Reader(path) as reader:
+                    for edit in reader.iter_edits():
+                        for key, check in todo.items():
+                            results[key] += check.visit_m2_edit(layer, partition, edit) or []
+            validated += len(todo)
+
+            for check in m2_checks:
+                key = _hash([check.name, check.version, layer.value, partition, m2_hash,
+                             check.m2_context(layer, partition)])
+                check.problems.extend(results[key])
+
+    return M2Results(results, validated, len(results))
+
+
+def _document_keys(checks, corpora, file_hashes):
+    """Return {doc_id: {check name: hash of the check and its inputs}}. """
+
+    versions = collections.defaultdict(list)  # doc_id => [(layer, corpus, meta)]
+    for layer, corpus in zip(LAYERS, corpora):
+        for meta in corpus._get_metadata():
+            versions[meta.doc_id].append((layer, corpus, meta))
+
+    keys = {}
+    for doc_id, doc_versions in versions.items():
+        keys[doc_id] = {}
+        for check in checks:
+            inputs = [
+                (layer.value, meta.annotator_id, view,
+                 file_hashes.get(_view_path(corpus, meta, view)))
+                for layer, corpus, meta in doc_versions if layer in check.layers
+                for view in check.inputs
+            ]
+            keys[doc_id][check.name] = _hash([check.name, check.version, doc_id, inputs])
+    return keys
+
+
+def _view_path(corpus, meta, view):
+    if view == "annotated":
+        return corpus._annotated_path(meta)
+    return corpus._view_path(meta, view)
+
+
+def _hash(value):
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hooks(checks, name):
+    """Return (check, bound hook) of the checks that override hook `name`. """
+
+    return [
+        (check, getattr(check, name)) for check in checks
+        if getattr(type(check), name) is not getattr(Check, name)
+    ]
+
+
+class FileHashes:
+    """SHA-256 of files, reused from `stored` if their size and mtime match.
+
+    Args:
+        stored (dict): path => [size, mtime_ns, hex digest] of a previous run.
+
+    Hashes of all files requested in this run are kept in `current`.
+    """
+
+    def __init__(self, stored=None):
+        self.stored = stored or {}
+        self.current = {}
+
+    def get(self, path):
+        """Return hex digest of the file, or None if it doesn't exist. """
+
+        path = str(path)
+        if path in self.current:
+            return self.current[path][2]
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        entry = self.stored.get(path)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            digest = entry[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        self.current[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+class ValidationCache:
+    """Results of previous validation runs.
+
+    Attributes:
+        documents (dict): hash of a check and its inputs => results of the
+            check on the document.
+        m2 (dict): hash of a check, an M2 file and the check's context =>
+            problems.
+        files (dict): see `FileHashes`.
+    """
+
+    def __init__(self, documents=None, m2=None, files=None):
+        self.documents = documents or {}
+        self.m2 = m2 or {}
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path):
+        """Load a cache saved with `save()`. Return an empty cache if it
+        doesn't exist or was saved by another version.
+        """
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if data.get("version") != CACHE_VERSION:
+            return cls()
+        return cls(data["documents"], data["m2"], data["files"])
+
+    def save(self, path):
+        """Write the cache atomically. """
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "version": CACHE_VERSION,
+            "documents": self.documents,
+            "m2": self.m2,
+            "files": self.files,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp_path, path)
+
+
+def make_report(checks, strict=False):
+    failing = {"error", "warning"} if strict else {"error"}
+    report = {"checks": {check.name: check.to_dict() for check in checks}}
+    report["passed"] = all(
+        result["passed"] or result["severity"] not in failing
+        for result in report["checks"].values())
+    return report
 
 
 def main():
-    corpus = Corpus("all")
-
-    check_fluency_in_gec_only()
-    check_m2_error_types()
-    check_files_without_annotations(corpus)
-    check_files_with_missing_detailed_annotations(corpus)
-    check_double_annotated(corpus)
-    check_gec_only_and_gec_fluency_source_match()
-    check_number_of_source_and_target_sentences()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes validating shards of the corpus")
+    parser.add_argument("--report", help="write the results as JSON to this file")
+    parser.add_argument("--strict", action="store_true",
+                        help="fail on warnings too")
+    parser.add_argument("--cache", default=DEFAULT_CACHE,
+                        help="JSON file with results of previous runs (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="validate everything, don't read or write the cache")
+    args = parser.parse_args()
+
+    cache = ValidationCache() if args.no_cache else ValidationCache.load(args.cache)
+    checks = validate(args.workers, cache)
+    if not args.no_cache:
+        cache.save(args.cache)
+    for check in checks:
+        check.print()
+
+    report = make_report(checks, args.strict)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+    sys.exit(0 if report["passed"] else 1)
 
 
 if __name__ == "__main__":